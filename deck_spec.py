@@ -0,0 +1,91 @@
+# deck_spec.py
+import os
+import json
+
+class DeckCard:
+    """A card rendered from a chosen subset of layers of a master PSD"""
+
+    def __init__(self, source, layers=None):
+        self.source = source
+        self.layers = tuple(layers) if layers else ()
+
+    def __fspath__(self):
+        return self.source
+
+    def __str__(self):
+        name = os.path.basename(self.source)
+        if self.layers:
+            return f"{name} [{', '.join(self.layers)}]"
+        return name
+
+    def __repr__(self):
+        return f"DeckCard({self.source!r}, {list(self.layers)!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, DeckCard):
+            return NotImplemented
+        return (self.source, self.layers) == (other.source, other.layers)
+
+    def __lt__(self, other):
+        if not isinstance(other, DeckCard):
+            return NotImplemented
+        return (self.source, self.layers) < (other.source, other.layers)
+
+    def __hash__(self):
+        return hash((self.source, self.layers))
+
+def parse_card_entry(entry, base_dir):
+    """Turn one entry of the spec's card list into a path or DeckCard"""
+    if isinstance(entry, str):
+        return os.path.join(base_dir, entry), 1
+
+    if not isinstance(entry, dict) or 'source' not in entry:
+        raise ValueError(f"Invalid card entry: {entry!r}")
+
+    source = os.path.join(base_dir, entry['source'])
+    layers = entry.get('layers')
+    copies = int(entry.get('copies', 1))
+
+    if layers:
+        return DeckCard(source, layers), copies
+    return source, copies
+
+def load_deck_spec(spec_path):
+    """
+    Load a JSON deck spec
+    Args:
+        spec_path: Path to the spec file. Relative card paths are resolved against its folder.
+    Returns:
+        tuple: (list of recto cards, verso card or None)
+
+    Example spec:
+        {
+            "verso": "back.psd",
+            "cards": [
+                "dragon.png",
+                {"source": "master.psd", "layers": ["Artwork", "Frame/Foil", "Text/EN"]},
+                {"source": "master.psd", "layers": ["Artwork", "Frame/Foil", "Text/FR"], "copies": 3}
+            ]
+        }
+
+    Layer names may be nested group paths separated by "/".
+    """
+    try:
+        with open(spec_path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+
+        base_dir = os.path.dirname(os.path.abspath(spec_path))
+
+        cards = []
+        for entry in spec.get('cards', []):
+            card, copies = parse_card_entry(entry, base_dir)
+            cards.extend([card] * copies)
+
+        verso = None
+        if spec.get('verso'):
+            verso, _ = parse_card_entry(spec['verso'], base_dir)
+
+        return cards, verso
+
+    except Exception as e:
+        raise ValueError(f"Error loading deck spec {os.path.basename(spec_path)}: {str(e)}")
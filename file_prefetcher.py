@@ -0,0 +1,133 @@
+# file_prefetcher.py
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class FilePrefetcher:
+    """
+    Reads the bytes of upcoming input files on background threads so slow or
+    network storage is read while earlier cards are being decoded.
+    Read-ahead is bounded by a number of files and a byte budget.
+    """
+
+    def __init__(self, depth=4, budget_mb=512, threads=2, keep_data=True):
+        """
+        Args:
+            keep_data: Hold the bytes for get(). Otherwise files are only read into the
+                operating system's cache, for decode worker processes that open them
+        """
+        self.depth = max(1, int(depth))
+        self.keep_data = keep_data
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.in_flight = deque()
+        self.buffered_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def schedule(self, paths):
+        """Queue files in the order they will be requested"""
+        with self.lock:
+            for path in paths:
+                # A run of the same file (the verso) is read once
+                if self.pending and self.pending[-1] == path:
+                    continue
+                self.pending.append(path)
+            self.fill()
+
+    def fill(self):
+        """Start reads until the depth or byte budget is reached, call with the lock held"""
+        while self.pending and len(self.in_flight) < self.depth:
+            path = self.pending[0]
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # Unreadable files are left to the decoder, which reports the error
+                self.pending.popleft()
+                continue
+
+            # A file larger than the budget is still read when nothing else is buffered
+            if self.in_flight and self.buffered_bytes + size > self.budget_bytes:
+                break
+
+            self.pending.popleft()
+            self.buffered_bytes += size
+            self.in_flight.append((path, size, self.executor.submit(self.read_file, path)))
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            if self.keep_data:
+                return f.read()
+            while f.read(1024 * 1024):
+                pass
+            return None
+
+    def take(self, path):
+        """Remove a scheduled file and the ones before it from the queue and return its entry"""
+        with self.lock:
+            entry = None
+            # Files scheduled before this one were skipped by the caller
+            while self.in_flight:
+                candidate = self.in_flight.popleft()
+                self.buffered_bytes -= candidate[1]
+                if candidate[0] == path:
+                    entry = candidate
+                    break
+                candidate[2].cancel()
+
+            if entry is None:
+                while self.pending and self.pending[0] != path:
+                    self.pending.popleft()
+                if self.pending:
+                    self.pending.popleft()
+
+            self.fill()
+        return entry
+
+    def get(self, path):
+        """
+        Return the bytes of a scheduled file, waiting for its read to finish
+        Returns None if the file was not prefetched, the caller then reads it itself
+        """
+        entry = self.take(path)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            data = entry[2].result()
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    def handed_over(self, path):
+        """Note that a scheduled file is being opened by another process, without waiting for it"""
+        entry = self.take(path)
+        # Files still being read are finished by the reader and the worker together
+        if entry is not None and entry[2].done():
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def close(self):
+        """Drop queued reads and stop the reader threads"""
+        with self.lock:
+            self.pending.clear()
+            for _, _, future in self.in_flight:
+                future.cancel()
+            self.in_flight.clear()
+            self.buffered_bytes = 0
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,216 @@
+# folder_watcher.py
+import os
+import sys
+import math
+import time
+import argparse
+from datetime import datetime
+
+from pdf_creator import PDFCreator
+from image_loaders import SUPPORTED_EXTENSIONS
+
+class FolderWatcher:
+    """Watch a directory tree and rebuild the sheets affected by new or changed card files"""
+
+    CARDS_PER_SHEET = 9  # Fixed 3x3 grid
+    INPUT_EXTENSIONS = SUPPORTED_EXTENSIONS
+
+    def __init__(self, watch_dir, verso_file, output_path, dpi=300, reg_marks=True,
+                 color_bars=True, optimize=True, poll_interval=2.0, debounce=3.0, workers=1,
+                 scratch_dir=None, scratch_quota_mb=None):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.verso_file = os.path.abspath(verso_file)
+        self.output_path = os.path.abspath(output_path)
+        self.dpi = dpi
+        self.reg_marks = reg_marks
+        self.color_bars = color_bars
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+
+        # Sheet PDFs are kept between rebuilds so unchanged sheets can be reused
+        self.pdf_creator = PDFCreator(scratch_dir=scratch_dir, scratch_quota_mb=scratch_quota_mb)
+        self.pdf_creator.set_optimization(optimize)
+        self.pdf_creator.set_workers(workers)
+
+        self.sheet_signatures = {}
+        self.built_snapshot = None
+
+    def scan(self):
+        """Return a {path: (mtime_ns, size)} snapshot of the watched inputs"""
+        snapshot = {}
+        pending = [self.watch_dir]
+
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                print(f"Warning: Could not scan {directory}: {str(e)}")
+                continue
+
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.lower().endswith(self.INPUT_EXTENSIONS):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # File vanished between listing and stat
+                        continue
+                    snapshot[os.path.abspath(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
+
+    def file_signature(self, path):
+        """Return the (mtime_ns, size) of a single file"""
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def build(self, snapshot):
+        """Rebuild the sheets whose cards changed and re-merge the output PDF"""
+        recto_files = sorted(
+            (path for path in snapshot if path != self.verso_file),
+            key=lambda path: os.path.relpath(path, self.watch_dir).lower()
+        )
+        if not recto_files:
+            print("No recto files found, nothing to build")
+            return
+
+        verso_signature = self.file_signature(self.verso_file)
+        total_sheets = math.ceil(len(recto_files) / self.CARDS_PER_SHEET)
+        generated_pdfs = []
+        rebuilt = 0
+
+        for sheet_num in range(total_sheets):
+            start_idx = sheet_num * self.CARDS_PER_SHEET
+            current_recto_files = recto_files[start_idx:start_idx + self.CARDS_PER_SHEET]
+
+            # A sheet only needs rebuilding if one of its cards or the verso changed
+            signature = (
+                tuple((path, snapshot[path]) for path in current_recto_files),
+                verso_signature
+            )
+
+            recto_pdf, verso_pdf = self.pdf_creator.sheet_paths(sheet_num)
+
+            if (self.sheet_signatures.get(sheet_num) == signature
+                    and os.path.exists(recto_pdf) and os.path.exists(verso_pdf)):
+                generated_pdfs.extend([recto_pdf, verso_pdf])
+                continue
+
+            print(f"\nRebuilding sheet {sheet_num + 1} of {total_sheets}")
+            generated_pdfs.extend(self.pdf_creator.create_sheet_pair(
+                sheet_num,
+                current_recto_files,
+                self.verso_file,
+                dpi=self.dpi,
+                reg_marks=self.reg_marks,
+                color_bars=self.color_bars
+            ))
+            self.sheet_signatures[sheet_num] = signature
+            rebuilt += 1
+
+        # Drop sheets left over from a larger previous deck
+        for sheet_num in [n for n in self.sheet_signatures if n >= total_sheets]:
+            del self.sheet_signatures[sheet_num]
+            for stale_pdf in self.pdf_creator.sheet_paths(sheet_num):
+                self.pdf_creator.scratch.remove_file(stale_pdf)
+
+        # Write next to the target and swap in, so readers never see a partial PDF
+        partial_path = self.output_path + ".partial"
+        self.pdf_creator.merge_pdfs(generated_pdfs, partial_path)
+        os.replace(partial_path, self.output_path)
+
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] Rebuilt {rebuilt} of {total_sheets} sheets -> {self.output_path}")
+        print(self.pdf_creator.scratch.throughput_report())
+
+    def run(self, once=False):
+        """Poll the watched tree until interrupted, building after each quiet period"""
+        print(f"Watching {self.watch_dir} (poll every {self.poll_interval}s, "
+              f"debounce {self.debounce}s)")
+
+        last_snapshot = None
+        last_change = time.monotonic()
+
+        try:
+            while True:
+                snapshot = self.scan()
+                try:
+                    snapshot[self.verso_file] = self.file_signature(self.verso_file)
+                except OSError:
+                    print(f"Warning: Verso file missing: {self.verso_file}")
+                    time.sleep(self.poll_interval)
+                    continue
+
+                if snapshot != last_snapshot:
+                    # Still being written to, wait for the burst to settle
+                    last_snapshot = snapshot
+                    last_change = time.monotonic()
+                elif (snapshot != self.built_snapshot
+                        and time.monotonic() - last_change >= self.debounce):
+                    try:
+                        self.build(snapshot)
+                        self.built_snapshot = snapshot
+                    except Exception as e:
+                        # Keep watching, the next change will trigger another attempt
+                        print(f"Error building sheets: {str(e)}")
+                        self.built_snapshot = snapshot
+
+                    if once:
+                        break
+
+                time.sleep(self.poll_interval)
+
+        except KeyboardInterrupt:
+            print("\nStopped watching")
+
+        finally:
+            self.pdf_creator.cleanup()
+
+def main():
+    """Command line entry point for watch-folder mode"""
+    parser = argparse.ArgumentParser(
+        description="Watch a folder of PSD files and rebuild the print PDF as they change"
+    )
+    parser.add_argument("watch_dir", help="Directory tree containing the recto PSD files")
+    parser.add_argument("--verso", required=True, help="PSD file used for the verso side")
+    parser.add_argument("--output", help="Output PDF path (default: <watch_dir>/cards.pdf)")
+    parser.add_argument("--dpi", type=int, default=300, choices=[150, 300, 600])
+    parser.add_argument("--no-reg-marks", action="store_true", help="Omit registration marks")
+    parser.add_argument("--no-color-bars", action="store_true", help="Omit color bars")
+    parser.add_argument("--no-optimize", action="store_true", help="Disable PDF size optimization")
+    parser.add_argument("--interval", type=float, default=2.0, help="Polling interval in seconds")
+    parser.add_argument("--debounce", type=float, default=3.0,
+                        help="Seconds without changes before rebuilding")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel decode processes")
+    parser.add_argument("--scratch-dir",
+                        help='Directory for intermediate files, "ram" for a RAM disk')
+    parser.add_argument("--scratch-quota-mb", type=float, help="Maximum size of intermediate files")
+    parser.add_argument("--once", action="store_true", help="Build once and exit")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.watch_dir):
+        parser.error(f"Not a directory: {args.watch_dir}")
+    if not os.path.isfile(args.verso):
+        parser.error(f"Verso file not found: {args.verso}")
+
+    watcher = FolderWatcher(
+        args.watch_dir,
+        args.verso,
+        args.output or os.path.join(args.watch_dir, "cards.pdf"),
+        dpi=args.dpi,
+        reg_marks=not args.no_reg_marks,
+        color_bars=not args.no_color_bars,
+        optimize=not args.no_optimize,
+        poll_interval=args.interval,
+        debounce=args.debounce,
+        workers=args.workers,
+        scratch_dir=args.scratch_dir,
+        scratch_quota_mb=args.scratch_quota_mb
+    )
+    watcher.run(once=args.once)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
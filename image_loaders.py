@@ -0,0 +1,437 @@
+# image_loaders.py
+import io
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from PIL import Image
+from psd_tools import PSDImage
+
+PSD_EXTENSIONS = ('.psd', '.psb')
+FLAT_EXTENSIONS = ('.png', '.tif', '.tiff', '.jpg', '.jpeg')
+SUPPORTED_EXTENSIONS = PSD_EXTENSIONS + FLAT_EXTENSIONS
+
+# PSD colour mode identifiers from the file header
+COLOR_MODES = {
+    0: "Bitmap",
+    1: "Grayscale",
+    2: "Indexed",
+    3: "RGB",
+    4: "CMYK",
+    7: "Multichannel",
+    8: "Duotone",
+    9: "Lab"
+}
+
+# PIL image modes mapped to the same colour mode names
+PIL_COLOR_MODES = {
+    '1': "Bitmap",
+    'L': "Grayscale",
+    'LA': "Grayscale",
+    'I;16': "Grayscale",
+    'I;16B': "Grayscale",
+    'P': "Indexed",
+    'RGB': "RGB",
+    'RGBA': "RGB",
+    'CMYK': "CMYK",
+    'LAB': "Lab"
+}
+
+RESOLUTION_INFO_ID = 0x03ED
+THUMBNAIL_RESOURCE_ID = 0x040C
+
+def read_psd_resources(psd_path, resource_ids=()):
+    """
+    Read the PSD file header and selected image resources without decoding any pixels
+    Args:
+        psd_path: Path to PSD or PSB file
+        resource_ids: Image resource IDs whose raw data should be returned
+    Returns:
+        tuple: (header fields, {resource_id: bytes})
+    """
+    with open(psd_path, 'rb') as f:
+        header = f.read(26)
+        if len(header) < 26:
+            raise ValueError("File is truncated")
+
+        signature, version, _, channels, height, width, depth, color_mode = struct.unpack(
+            '>4sH6sHIIHH', header
+        )
+        if signature != b'8BPS':
+            raise ValueError("Not a Photoshop file")
+        if version not in (1, 2):
+            raise ValueError(f"Unsupported PSD version {version}")
+
+        # Skip the colour mode data section
+        (color_data_length,) = struct.unpack('>I', f.read(4))
+        f.seek(color_data_length, os.SEEK_CUR)
+
+        # Walk the image resources, reading only the requested ones
+        (resources_length,) = struct.unpack('>I', f.read(4))
+        resources_end = f.tell() + resources_length
+        resources = {}
+
+        while f.tell() + 12 <= resources_end and len(resources) < len(resource_ids):
+            if f.read(4) != b'8BIM':
+                raise ValueError("Corrupt image resource section")
+            (resource_id, name_length) = struct.unpack('>HB', f.read(3))
+            # Pascal string name, padded so the length byte plus name is even
+            f.seek(name_length + ((name_length + 1) % 2), os.SEEK_CUR)
+            (data_length,) = struct.unpack('>I', f.read(4))
+
+            if resource_id in resource_ids:
+                resources[resource_id] = f.read(data_length)
+                f.seek(data_length % 2, os.SEEK_CUR)
+            else:
+                f.seek(data_length + (data_length % 2), os.SEEK_CUR)
+
+    fields = {
+        'width': width,
+        'height': height,
+        'channels': channels,
+        'depth': depth,
+        'color_mode': COLOR_MODES.get(color_mode, f"Unknown ({color_mode})"),
+        'version': version
+    }
+    return fields, resources
+
+def read_psd_header(psd_path):
+    """
+    Read the PSD file header and resolution resource without decoding any pixels
+    Args:
+        psd_path: Path to PSD or PSB file
+    Returns:
+        dict: width, height, channels, depth, color_mode, version and dpi (or None)
+    """
+    header, resources = read_psd_resources(psd_path, (RESOLUTION_INFO_ID,))
+    header['dpi'] = None
+
+    data = resources.get(RESOLUTION_INFO_ID)
+    if data and len(data) >= 16:
+        h_res, h_unit, _, v_res, v_unit, _ = struct.unpack('>IHHIHH', data[:16])
+        h_dpi = h_res / 65536.0
+        v_dpi = v_res / 65536.0
+        # Unit 2 means pixels per centimetre
+        if h_unit == 2:
+            h_dpi *= 2.54
+        if v_unit == 2:
+            v_dpi *= 2.54
+        header['dpi'] = (h_dpi, v_dpi)
+
+    return header
+
+def read_psd_thumbnail(psd_path):
+    """Return the JPEG thumbnail Photoshop embeds in the image resources, or None"""
+    _, resources = read_psd_resources(psd_path, (THUMBNAIL_RESOURCE_ID,))
+    data = resources.get(THUMBNAIL_RESOURCE_ID)
+    if not data or len(data) <= 28:
+        return None
+
+    # A 28 byte descriptor precedes the JFIF data
+    image = Image.open(io.BytesIO(data[28:]))
+    image.load()
+    return image
+
+def open_source(path, data=None):
+    """Return a file object over already-read contents, or the path itself"""
+    return io.BytesIO(data) if data is not None else path
+
+def flatten_to_rgb(image):
+    """Composite transparency onto white and convert to a mode JPEG can store"""
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+
+    if image.mode in ['RGBA', 'LA']:
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+
+    # 16-bit greyscale is scaled to 8-bit first, a plain convert clips everything above 255
+    if image.mode.startswith('I;16'):
+        image = image.convert('I')
+    if image.mode == 'I':
+        image = image.point(lambda value: value / 256).convert('L')
+
+    if image.mode not in ['RGB', 'L']:
+        image = image.convert('RGB')
+
+    return image
+
+class ImageLoader(ABC):
+    """Base class for input format loaders"""
+
+    extensions = ()
+
+    @abstractmethod
+    def load(self, path, target_size=None, data=None):
+        """
+        Decode the file and return an RGB (or greyscale) PIL Image
+        data holds the file contents when they were already read into memory
+        """
+
+    @abstractmethod
+    def read_info(self, path):
+        """Return size, colour mode, bit depth and DPI without decoding pixels"""
+
+class PSDLoader(ImageLoader):
+    """Loader for layered Photoshop documents"""
+
+    extensions = PSD_EXTENSIONS
+
+    def load(self, path, target_size=None, data=None):
+        psd = PSDImage.open(open_source(path, data))
+        image = psd.topil()
+
+        if image is None:
+            raise ValueError(f"Could not process PSD file: {path}")
+
+        return flatten_to_rgb(image)
+
+    def read_info(self, path):
+        return read_psd_header(path)
+
+class FlatImageLoader(ImageLoader):
+    """Loader for pre-rendered PNG, TIFF and JPEG files"""
+
+    extensions = FLAT_EXTENSIONS
+
+    def load(self, path, target_size=None, data=None):
+        image = Image.open(open_source(path, data))
+
+        # JPEG can decode straight to a reduced size, never smaller than the target
+        if target_size and image.format == 'JPEG':
+            image.draft('RGB', target_size)
+
+        image.load()
+        return flatten_to_rgb(image)
+
+    def read_info(self, path):
+        # Image.open only parses the header, pixels are decoded on load()
+        with Image.open(path) as image:
+            depth = 16 if image.mode.startswith('I;16') else 8
+            if image.mode == '1':
+                depth = 1
+            dpi = image.info.get('dpi')
+
+            return {
+                'width': image.width,
+                'height': image.height,
+                'channels': len(image.getbands()),
+                'depth': depth,
+                'color_mode': PIL_COLOR_MODES.get(image.mode, image.mode),
+                'version': None,
+                'dpi': tuple(float(value) for value in dpi) if dpi else None
+            }
+
+class LayeredPSDLoader(ImageLoader):
+    """
+    Loader that composites only selected layers or groups of a master PSD.
+    Each selected layer is composited on its own and cached, so variants that share
+    artwork and differ only in one group (language, foil frame) re-render just that group.
+    Cached layers are stacked in document order with normal blending.
+    """
+
+    extensions = PSD_EXTENSIONS
+
+    def __init__(self, max_documents=4, cache_bytes=512 * 1024 * 1024):
+        self.max_documents = max_documents
+        self.cache_bytes = cache_bytes
+        self.documents = OrderedDict()
+        self.layer_cache = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def open_document(self, path, data=None):
+        """Return the parsed PSD for a path, reusing it while the file is unchanged"""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            if key in self.documents:
+                self.documents.move_to_end(key)
+                return key, self.documents[key]
+
+        psd = PSDImage.open(open_source(path, data))
+
+        with self.lock:
+            self.documents[key] = psd
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+
+        return key, psd
+
+    def find_layer(self, psd, layer_path):
+        """Resolve a "Group/Sub group/Layer" path to a layer"""
+        current = psd
+        for name in layer_path.split('/'):
+            matches = [layer for layer in current if layer.name == name]
+            if not matches:
+                raise ValueError(f"Layer not found: {layer_path}")
+            current = matches[0]
+        return current
+
+    def render_layer(self, document_key, psd, layer_path):
+        """Composite a single layer or group onto a transparent full-size canvas"""
+        cache_key = (document_key, layer_path)
+
+        with self.lock:
+            if cache_key in self.layer_cache:
+                self.layer_cache.move_to_end(cache_key)
+                return self.layer_cache[cache_key]
+
+        layer = self.find_layer(psd, layer_path)
+
+        # The selected layer is drawn even if hidden in the master, its children keep their visibility
+        image = layer.composite(
+            viewport=psd.viewbox,
+            layer_filter=lambda child: child is layer or child.visible
+        )
+        if image is None:
+            image = Image.new('RGBA', psd.size, (0, 0, 0, 0))
+        elif image.mode != 'RGBA':
+            image = image.convert('RGBA')
+
+        size = image.width * image.height * 4
+        with self.lock:
+            self.layer_cache[cache_key] = image
+            self.cached_bytes += size
+            while self.cached_bytes > self.cache_bytes and len(self.layer_cache) > 1:
+                _, evicted = self.layer_cache.popitem(last=False)
+                self.cached_bytes -= evicted.width * evicted.height * 4
+
+        return image
+
+    def load(self, card, target_size=None, data=None):
+        document_key, psd = self.open_document(card.source, data)
+
+        # Stack the selected layers bottom to top as they appear in the document
+        order = {id(layer): i for i, layer in enumerate(psd.descendants())}
+        layer_paths = sorted(
+            card.layers,
+            key=lambda layer_path: order[id(self.find_layer(psd, layer_path))]
+        )
+
+        image = Image.new('RGBA', psd.size, (0, 0, 0, 0))
+        for layer_path in layer_paths:
+            image.alpha_composite(self.render_layer(document_key, psd, layer_path))
+
+        return flatten_to_rgb(image)
+
+    def read_info(self, card):
+        return read_psd_header(card.source)
+
+PSD_LOADER = PSDLoader()
+FLAT_LOADER = FlatImageLoader()
+LAYERED_PSD_LOADER = LayeredPSDLoader()
+
+def get_loader(path, data=None):
+    """Return the loader for a file, sniffing the signature before the extension"""
+    # Deck spec cards that select layers of a master PSD
+    if getattr(path, 'layers', None):
+        return LAYERED_PSD_LOADER
+
+    if data is not None:
+        signature = data[:4]
+    else:
+        try:
+            with open(path, 'rb') as f:
+                signature = f.read(4)
+        except OSError:
+            signature = b''
+
+    if signature == b'8BPS':
+        return PSD_LOADER
+    if signature.startswith((b'\x89PNG', b'\xff\xd8', b'II*\x00', b'MM\x00*')):
+        return FLAT_LOADER
+
+    if os.path.splitext(os.fspath(path))[1].lower() in FLAT_EXTENSIONS:
+        return FLAT_LOADER
+    return PSD_LOADER
+
+def load_image(path, target_size=None, data=None):
+    """
+    Load any supported input file as a flattened PIL Image
+    Args:
+        path: Path to a PSD, PSB, PNG, TIFF or JPEG file, or a layer-selecting DeckCard
+        target_size: Optional final (width, height) in pixels, used for reduced-size decoding
+        data: Optional file contents already read into memory (prefetched)
+    Returns:
+        PIL Image: RGB or greyscale image
+    """
+    return get_loader(path, data).load(path, target_size, data)
+
+def read_image_info(path):
+    """Return header information for any supported input file"""
+    return get_loader(path).read_info(path)
+
+class ThumbnailCache:
+    """Thread-safe cache of small previews, keyed by file and modification time"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, source, max_size):
+        """Return a thumbnail no larger than max_size, decoding it on first use"""
+        stat = os.stat(source)
+        key = (source, stat.st_mtime_ns, tuple(max_size))
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        image = None
+        if get_loader(source) is PSD_LOADER:
+            # The embedded preview avoids parsing the layers at all
+            try:
+                image = read_psd_thumbnail(source)
+            except Exception:
+                image = None
+
+        if image is None:
+            image = load_image(source, max_size)
+
+        image = flatten_to_rgb(image)
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+        with self.lock:
+            self.entries[key] = image
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return image
+
+THUMBNAIL_CACHE = ThumbnailCache()
+
+class DecodedImageCache:
+    """
+    Full-resolution decodes kept from one pass of a job for the next pass.
+    Passes walk the deck in the same order, so once the byte budget is used up
+    new images are refused rather than evicting the ones needed first.
+    """
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def put(self, source, image):
+        size = image.width * image.height * len(image.getbands())
+        with self.lock:
+            if source in self.entries or self.cached_bytes + size > self.max_bytes:
+                return
+            self.entries[source] = image
+            self.cached_bytes += size
+
+    def get(self, source):
+        with self.lock:
+            return self.entries.get(source)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.cached_bytes = 0
@@ -0,0 +1,78 @@
+# image_pyramid.py
+from collections import OrderedDict
+from PIL import Image
+
+class ImagePyramid:
+    """
+    Mip-map pyramid of an image, built once, used to render zoomed tiles
+    from the smallest level that still has enough detail
+    """
+
+    def __init__(self, image, tile_size=256, max_cached_tiles=512):
+        if image.mode not in ['RGB', 'L']:
+            image = image.convert('RGB')
+
+        self.tile_size = tile_size
+        self.max_cached_tiles = max_cached_tiles
+        self.tile_cache = OrderedDict()
+
+        # Each level halves the previous one until it fits in a single tile
+        self.levels = [image]
+        while max(self.levels[-1].size) > tile_size:
+            self.levels.append(self.levels[-1].reduce(2))
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def zoomed_size(self, zoom):
+        """Return the (width, height) of the whole image at a zoom factor"""
+        width, height = self.size
+        return max(1, int(width * zoom)), max(1, int(height * zoom))
+
+    def level_for_zoom(self, zoom):
+        """Return the index of the smallest level with at least zoom-level detail"""
+        index = 0
+        for i, level in enumerate(self.levels):
+            if level.width >= self.size[0] * zoom:
+                index = i
+            else:
+                break
+        return index
+
+    def tile_grid(self, zoom):
+        """Return the number of (columns, rows) of tiles at a zoom factor"""
+        width, height = self.zoomed_size(zoom)
+        return (-(-width // self.tile_size), -(-height // self.tile_size))
+
+    def get_tile(self, zoom, column, row):
+        """Return a PIL Image for one tile at a zoom factor, cached"""
+        key = (zoom, column, row)
+        if key in self.tile_cache:
+            self.tile_cache.move_to_end(key)
+            return self.tile_cache[key]
+
+        tile = self.render_tile(zoom, column, row)
+
+        self.tile_cache[key] = tile
+        while len(self.tile_cache) > self.max_cached_tiles:
+            self.tile_cache.popitem(last=False)
+
+        return tile
+
+    def render_tile(self, zoom, column, row):
+        """Resample one tile straight from the best pyramid level"""
+        zoomed_width, zoomed_height = self.zoomed_size(zoom)
+        x0 = column * self.tile_size
+        y0 = row * self.tile_size
+        x1 = min(x0 + self.tile_size, zoomed_width)
+        y1 = min(y0 + self.tile_size, zoomed_height)
+
+        level = self.levels[self.level_for_zoom(zoom)]
+        scale_x = level.width / zoomed_width
+        scale_y = level.height / zoomed_height
+
+        # Only the source region under this tile is resampled
+        box = (x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y)
+        resample = Image.Resampling.LANCZOS if scale_x > 1 else Image.Resampling.BILINEAR
+        return level.resize((x1 - x0, y1 - y0), resample, box=box)
@@ -0,0 +1,302 @@
+# isolated_pool.py
+import time
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from collections import deque
+from concurrent.futures import Future
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, memory limits are skipped there
+    resource = None
+
+class DecodeTimeout(Exception):
+    """Raised when a task runs longer than the pool's time limit"""
+
+class WorkerCrashed(Exception):
+    """Raised when a worker process dies or runs out of memory during a task"""
+
+def isolated_worker_main(connection, memory_limit_bytes):
+    """Run tasks sent over a pipe until told to stop, under an address space limit"""
+    if memory_limit_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        function, args = task
+        try:
+            result = ('ok', function(*args))
+        except MemoryError:
+            # The heap may be left fragmented, report and let the pool start a fresh process
+            connection.send(('exit', WorkerCrashed("Memory limit exceeded")))
+            return
+        except Exception as e:
+            result = ('error', e)
+
+        try:
+            connection.send(result)
+        except Exception as e:
+            # Exceptions that cannot be pickled are passed on as text
+            connection.send(('error', ValueError(f"{type(result[1]).__name__}: {result[1]}: {str(e)}")))
+
+class IsolatedWorkerPool:
+    """
+    Process pool in which every task has a time limit and every worker a memory
+    limit. A worker that hangs, crashes or runs out of memory is killed and
+    replaced, and only its own task fails; the other workers keep going.
+    Offers the submit() and shutdown() parts of the executor interface.
+    """
+
+    def __init__(self, max_workers, timeout=None, memory_limit_mb=None, on_worker_exit=None):
+        """
+        Args:
+            on_worker_exit: Called with the pid of every worker that is replaced
+        """
+        self.context = multiprocessing.get_context('spawn')
+        self.timeout = timeout
+        self.on_worker_exit = on_worker_exit
+        self.memory_limit_bytes = int(memory_limit_mb * 1024 * 1024) if memory_limit_mb else None
+
+        self.lock = threading.Lock()
+        self.tasks = deque()
+        self.shutting_down = False
+        self.wake_reader, self.wake_writer = self.context.Pipe(duplex=False)
+
+        self.workers = [self.start_worker() for _ in range(max(1, max_workers))]
+        self.thread = threading.Thread(target=self.supervise, daemon=True)
+        self.thread.start()
+
+    def start_worker(self, spare=False):
+        """Start a worker process, a spare one runs a single task and is not replaced"""
+        parent, child = self.context.Pipe()
+        process = self.context.Process(
+            target=isolated_worker_main, args=(child, self.memory_limit_bytes), daemon=True
+        )
+        process.start()
+        child.close()
+        return {'process': process, 'connection': parent, 'future': None, 'deadline': None,
+                'abort': False, 'spare': spare, 'retired': False}
+
+    def replace_worker(self, index, error=None):
+        """Kill a worker, fail its task with error and start a new process in its place"""
+        worker = self.workers[index]
+        if worker['process'].is_alive():
+            worker['process'].kill()
+        worker['process'].join()
+        worker['connection'].close()
+
+        future = worker['future']
+        if future is not None and not future.done():
+            future.set_exception(error or WorkerCrashed("Worker stopped"))
+        if self.on_worker_exit is not None:
+            self.on_worker_exit(worker['process'].pid)
+
+        if worker['spare']:
+            # Removed from the list once the supervisor is done with it
+            worker['retired'] = True
+        else:
+            self.workers[index] = self.start_worker()
+
+    def wake(self):
+        with self.lock:
+            if not self.shutting_down:
+                self.wake_writer.send(None)
+
+    def submit(self, function, *args, fresh_worker=False):
+        """
+        Queue a task and return a Future for its result
+        Args:
+            fresh_worker: Run the task in a new process of its own, so nothing left behind
+                by earlier tasks (a half-initialised library, a fragmented heap) affects it
+                and the regular workers keep going while it runs
+        """
+        future = Future()
+        with self.lock:
+            if self.shutting_down:
+                raise RuntimeError("Cannot submit to a pool that is shut down")
+            self.tasks.append((future, function, args, fresh_worker))
+        self.wake()
+        return future
+
+    def abort(self, future):
+        """Stop a task, killing its worker if it is already running, and wait until it has stopped"""
+        with self.lock:
+            for task in self.tasks:
+                if task[0] is future:
+                    self.tasks.remove(task)
+                    future.cancel()
+                    return
+            for worker in self.workers:
+                if worker['future'] is future:
+                    worker['abort'] = True
+        self.wake()
+
+        try:
+            future.exception()
+        except Exception:
+            pass
+
+    def dispatch(self):
+        """Hand queued tasks to idle workers, call with the lock held"""
+        # Tasks that asked for a fresh worker get a spare process of their own
+        for task in [task for task in self.tasks if task[3]]:
+            self.tasks.remove(task)
+            future, function, args, _ = task
+            if future.set_running_or_notify_cancel():
+                worker = self.start_worker(spare=True)
+                self.workers.append(worker)
+                self.start_task(worker, future, function, args)
+
+        for worker in self.workers:
+            while worker['future'] is None and not worker['spare'] and self.tasks:
+                future, function, args, _ = self.tasks.popleft()
+                if future.set_running_or_notify_cancel():
+                    self.start_task(worker, future, function, args)
+
+    def start_task(self, worker, future, function, args):
+        """Send a task to an idle worker, call with the lock held"""
+        worker['future'] = future
+        worker['deadline'] = time.monotonic() + self.timeout if self.timeout else None
+        try:
+            worker['connection'].send((function, args))
+        except (OSError, ValueError) as e:
+            # Died while idle, picked up by the supervisor
+            worker['abort'] = WorkerCrashed(f"Could not start task: {str(e)}")
+
+    def supervise(self):
+        """Dispatch tasks, collect results and enforce the limits, on a background thread"""
+        while True:
+            with self.lock:
+                if self.shutting_down:
+                    return
+                self.dispatch()
+
+                waitables = [self.wake_reader]
+                deadlines = []
+                for worker in self.workers:
+                    waitables.append(worker['process'].sentinel)
+                    if worker['future'] is not None:
+                        waitables.append(worker['connection'])
+                        if worker['deadline'] is not None:
+                            deadlines.append(worker['deadline'])
+
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready = wait(waitables, timeout)
+
+            with self.lock:
+                if self.shutting_down:
+                    return
+                while self.wake_reader.poll():
+                    self.wake_reader.recv()
+
+                now = time.monotonic()
+                for index, worker in enumerate(self.workers):
+                    future = worker['future']
+
+                    if future is not None and worker['connection'] in ready:
+                        try:
+                            status, value = worker['connection'].recv()
+                        except (EOFError, OSError):
+                            status, value = 'error', None
+                        if status == 'ok':
+                            future.set_result(value)
+                            worker['future'] = None
+                        elif value is not None:
+                            future.set_exception(value)
+                            worker['future'] = None
+                        if status == 'exit':
+                            # Replaced right away so no task is sent to the stopping process
+                            worker['abort'] = True
+
+                    if worker['abort']:
+                        error = worker['abort'] if isinstance(worker['abort'], Exception) else None
+                        self.replace_worker(index, error or WorkerCrashed("Task aborted"))
+                    elif not worker['process'].is_alive():
+                        exitcode = worker['process'].exitcode
+                        self.replace_worker(index, WorkerCrashed(f"Worker exited with code {exitcode}"))
+                    elif worker['future'] is not None and worker['deadline'] is not None and now >= worker['deadline']:
+                        self.replace_worker(index, DecodeTimeout(f"No result after {self.timeout:.0f} seconds"))
+                    elif worker['spare'] and worker['future'] is None:
+                        # Its one task is done
+                        self.replace_worker(index)
+
+                self.workers = [worker for worker in self.workers if not worker['retired']]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Stop all workers, failing tasks that are still running"""
+        with self.lock:
+            if self.shutting_down:
+                return
+            self.shutting_down = True
+            self.wake_writer.send(None)
+            pending = list(self.tasks)
+            self.tasks.clear()
+
+        for future, _, _, _ in pending:
+            future.cancel()
+        self.thread.join()
+
+        for worker in self.workers:
+            try:
+                worker['connection'].send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            worker['process'].join(timeout=1 if wait else 0)
+            if worker['process'].is_alive():
+                worker['process'].kill()
+                worker['process'].join()
+            worker['connection'].close()
+            if worker['future'] is not None and not worker['future'].done():
+                worker['future'].set_exception(WorkerCrashed("Pool shut down"))
+
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+def make_placeholder_card(size, source, reason):
+    """Return a clearly marked stand-in for a card that could not be decoded"""
+    image = Image.new('RGB', size, (235, 235, 235))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    line_width = max(2, width // 100)
+
+    draw.rectangle([0, 0, width - 1, height - 1], outline=(220, 0, 0), width=line_width * 2)
+    draw.line([(0, 0), (width, height)], fill=(220, 0, 0), width=line_width)
+    draw.line([(0, height), (width, 0)], fill=(220, 0, 0), width=line_width)
+
+    try:
+        font = ImageFont.load_default(size=max(10, width // 24))
+    except TypeError:
+        # Pillow before 10.1 only has the small bitmap font
+        font = ImageFont.load_default()
+
+    # The reason is wrapped to the card width
+    lines = ["DECODE FAILED", str(source)]
+    line = ""
+    for word in str(reason)[:200].split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=font) > width - line_width * 8:
+            lines.append(line)
+            candidate = word
+        line = candidate
+    if line:
+        lines.append(line)
+
+    y = height // 3
+    for text in lines:
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        x = max(line_width * 2, (width - (right - left)) // 2)
+        draw.rectangle([x - 4, y - 2, x + right - left + 4, y + bottom + 2], fill=(255, 255, 255))
+        draw.text((x, y), text, fill=(220, 0, 0), font=font)
+        y += bottom + line_width * 4
+
+    return image
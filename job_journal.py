@@ -0,0 +1,111 @@
+# job_journal.py
+import os
+import json
+import shutil
+import hashlib
+
+def source_signature(source):
+    """Return a JSON-friendly identity of an input file, including its layer selection"""
+    stat = os.stat(source)
+    return [os.path.abspath(os.fspath(source)), list(getattr(source, 'layers', ())),
+            stat.st_mtime_ns, stat.st_size]
+
+def file_fingerprint(path):
+    """Flush a finished file to disk and return its [size, sha256]"""
+    digest = hashlib.sha256()
+    with open(path, 'rb+') as f:
+        os.fsync(f.fileno())
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return [os.path.getsize(path), digest.hexdigest()]
+
+def make_signature(value):
+    """Hash a JSON-serialisable value into a short signature"""
+    data = json.dumps(value, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+class JobJournal:
+    """
+    Checkpoint journal of completed sheets, kept next to the output so a job
+    interrupted by a crash, cancel or reboot can resume from the last finished sheet
+    """
+
+    JOURNAL_NAME = "journal.jsonl"
+
+    def __init__(self, directory, job_settings, resume=True):
+        self.directory = directory
+        self.job_signature = make_signature(job_settings)
+        self.completed = {}
+
+        journal_path = os.path.join(directory, self.JOURNAL_NAME)
+        if resume and self.load(journal_path):
+            print(f"Resuming job, {len(self.completed)} sheets already completed")
+        else:
+            # Different settings or no journal, start over
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory, exist_ok=True)
+            with open(journal_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'job': self.job_signature}) + "\n")
+
+        self.journal_file = open(journal_path, 'a', encoding='utf-8')
+
+    def load(self, journal_path):
+        """Read completed sheets from an existing journal with matching settings"""
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+
+        try:
+            if not lines or json.loads(lines[0]).get('job') != self.job_signature:
+                return False
+
+            for line in lines[1:]:
+                entry = json.loads(line)
+                self.completed[entry['sheet']] = (entry['signature'], entry.get('files'))
+
+        except (ValueError, KeyError):
+            # A torn last line from a crash, keep what was read before it
+            pass
+
+        return True
+
+    def sheet_signature(self, recto_files, verso_file):
+        """Return the signature of one sheet's inputs"""
+        return make_signature({
+            'recto': [source_signature(source) for source in recto_files],
+            'verso': source_signature(verso_file)
+        })
+
+    def is_complete(self, sheet_num, signature, sheet_pdfs):
+        """
+        Return True if a sheet was finished with the same inputs and its PDFs are
+        still exactly as they were written (a reboot can leave them truncated)
+        """
+        recorded_signature, files = self.completed.get(sheet_num, (None, None))
+        if recorded_signature != signature or files is None or len(files) != len(sheet_pdfs):
+            return False
+
+        try:
+            return all(file_fingerprint(path) == fingerprint
+                       for path, fingerprint in zip(sheet_pdfs, files))
+        except OSError:
+            return False
+
+    def mark_complete(self, sheet_num, signature, sheet_pdfs):
+        """Record a finished sheet once its PDFs are on disk, before the next sheet starts"""
+        files = [file_fingerprint(path) for path in sheet_pdfs]
+        self.completed[sheet_num] = (signature, files)
+        self.journal_file.write(json.dumps({'sheet': sheet_num, 'signature': signature, 'files': files}) + "\n")
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def close(self):
+        if not self.journal_file.closed:
+            self.journal_file.close()
+
+    def finish(self):
+        """Remove the journal and sheet PDFs once the final PDF has been written"""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
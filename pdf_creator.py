@@ -1,7 +1,9 @@
 # pdf_creator.py
 import os
-import tempfile
-import shutil
+import time
+import queue
+import itertools
+from collections import deque
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
@@ -10,20 +12,199 @@ from psd_tools import PSDImage
 from PyPDF2 import PdfMerger
 import math
 
+from image_loaders import (
+    load_image, get_loader, read_psd_thumbnail, flatten_to_rgb,
+    DecodedImageCache, PSD_LOADER, FLAT_LOADER
+)
+from sheet_layout import SheetLayout
+from raster_spool import RasterSpool, SPOOL_BYTES_PER_PIXEL, write_image_to_slot
+from scratch_space import ScratchSpace
+from pdf_shards import write_shards, concatenate_shards
+from file_prefetcher import FilePrefetcher
+from tiff_export import write_sheet_tiff, COMPRESSION_NONE
+from resource_governor import ResourceGovernor, read_rss
+from isolated_pool import IsolatedWorkerPool, make_placeholder_card
+
+# Smallest default address space of an isolated worker, the interpreter and libraries alone take ~150 MB
+MIN_WORKER_MEMORY_MB = 512
+
+def read_draft_thumbnail(source):
+    """Return the embedded thumbnail of a PSD card as RGB, or None if there is none"""
+    if get_loader(source) is not PSD_LOADER:
+        return None
+    try:
+        thumbnail = read_psd_thumbnail(source)
+    except Exception:
+        return None
+    return flatten_to_rgb(thumbnail) if thumbnail is not None else None
+
+def decode_card_to_slot(slot_name, slot_size, source, target_size, draft=False):
+    """
+    Decode and resize one card in a worker process, writing the raster into a spool slot.
+    Drafts use the embedded PSD thumbnail where there is one
+    """
+    try:
+        image = read_draft_thumbnail(source) if draft else None
+        if image is None:
+            image = load_image(source, target_size)
+        if image.size != target_size:
+            image = image.resize(target_size, Image.Resampling.LANCZOS)
+        size = write_image_to_slot(slot_name, slot_size, image)
+        # Reported while the decoded image is still alive, for the resource governor
+        return size, os.getpid(), read_rss()
+
+    except MemoryError:
+        # Left to the isolated worker, which reports it and restarts
+        raise
+
+    except Exception as e:
+        raise ValueError(f"Error processing {os.path.basename(source)}: {str(e)}")
+
+class JobCancelled(Exception):
+    """Raised when a running job is cancelled by the user"""
+
+class RetriedCard:
+    """A card whose first decode failed, decoded again in a fresh worker"""
+
+    def __init__(self, source, future, spool, slot, target_size):
+        self.name = os.path.basename(source)
+        self.future = future
+        self.spool = spool
+        self.slot = slot
+        self.target_size = target_size
+        self.background = False
+
+class DeferredSheet:
+    """A sheet saved once its retried cards are done, while the writer goes on with the next sheets"""
+
+    def __init__(self, retried, finish):
+        self.retried = retried
+        self.finish = finish
+
+    def ready(self):
+        return all(card.future.done() for card in self.retried)
+
+class OutputTarget:
+    """One PDF written by a multi-target job"""
+
+    def __init__(self, output_path, dpi=300, optimize=True, reg_marks=True, color_bars=True):
+        self.output_path = output_path
+        self.dpi = dpi
+        self.optimize = optimize
+        self.reg_marks = reg_marks
+        self.color_bars = color_bars
+
 class PDFCreator:
-    def __init__(self, width_mm=None, height_mm=None):
+    def __init__(self, width_mm=None, height_mm=None, scratch_dir=None, scratch_quota_mb=None):
         """
         Initialize PDFCreator with default A4 dimensions
+        Args:
+            scratch_dir: Directory for intermediate files, "ram" for a RAM disk
+            scratch_quota_mb: Maximum size of intermediate files
         """
         self.width_mm = width_mm if width_mm is not None else 210  # A4 default
         self.height_mm = height_mm if height_mm is not None else 297  # A4 default
-        self.temp_dir = tempfile.mkdtemp()
+        self.scratch = ScratchSpace(scratch_dir, scratch_quota_mb)
+        self.temp_dir = self.scratch.path
         self.optimize = True
+        self.workers = 1
+        self.decode_pool = None
+        self.raster_spool = None
+        self.cancel_event = None
+        self.journal = None
+        self.sheets_per_shard = None
+        self.join_shards = False
+        self.prefetch_depth = 0
+        self.prefetch_budget_mb = 512
+        self.prefetcher = None
+        self.draft = False
+        self.decoded_cache = None
+        self.memory_budget_mb = None
+        self.governor = None
+        self.isolate = False
+        self.decode_timeout = 300
+        self.decode_memory_limit_mb = None
+        self.failed_cards = []
+        self.background_retries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
 
     def set_optimization(self, optimize):
         """Set PDF optimization flag"""
         self.optimize = optimize
 
+    def set_workers(self, workers):
+        """Set the number of parallel decode processes (1 decodes in-process)"""
+        self.workers = max(1, int(workers))
+
+    def set_cancel_event(self, cancel_event):
+        """Set a threading.Event that cancels the job when set"""
+        self.cancel_event = cancel_event
+
+    def set_journal(self, journal):
+        """Set a JobJournal used to skip sheets completed by an interrupted run"""
+        self.journal = journal
+
+    def set_sharding(self, sheets_per_shard, join_shards=False):
+        """
+        Write the output as standalone PDFs of sheets_per_shard sheets plus a manifest
+        instead of one file (None writes a single file)
+        Args:
+            join_shards: Also concatenate the shards into the single output file
+        """
+        self.sheets_per_shard = int(sheets_per_shard) if sheets_per_shard else None
+        self.join_shards = join_shards
+
+    def set_prefetch(self, depth, budget_mb=512):
+        """
+        Read up to depth upcoming files (at most budget_mb) ahead of the decoder
+        (0 disables read-ahead). The in-process decoder is handed the bytes, decode
+        workers find the files in the operating system's cache
+        """
+        self.prefetch_depth = max(0, int(depth))
+        self.prefetch_budget_mb = budget_mb
+
+    def set_memory_budget(self, memory_budget_mb):
+        """Set the memory the parallel decode workers may use (None uses most of the free memory)"""
+        self.memory_budget_mb = memory_budget_mb
+        self.governor = None
+        # Worker memory limits are derived from the budget
+        self.close_decode_pool()
+
+    def set_isolation(self, isolate=True, timeout=300, memory_limit_mb=None):
+        """
+        Decode every card in a worker process with a time and memory limit, even with
+        one worker. A card that fails twice is replaced by a marked placeholder
+        instead of failing the job
+        Args:
+            timeout: Seconds a single card may take (None for no limit)
+            memory_limit_mb: Address space of each worker (None for an equal share of
+                the memory budget, 0 for no limit)
+        """
+        self.isolate = isolate
+        self.decode_timeout = timeout
+        self.decode_memory_limit_mb = memory_limit_mb
+        self.close_decode_pool()
+
+    def uses_decode_pool(self):
+        """Return True if cards are decoded in worker processes"""
+        return self.workers > 1 or self.isolate
+
+    def worker_memory_limit_mb(self):
+        """Return the memory limit of each isolated decode worker in MB (None for no limit)"""
+        if self.decode_memory_limit_mb is not None:
+            return self.decode_memory_limit_mb or None
+        return max(MIN_WORKER_MEMORY_MB, self.governor.budget_bytes / 1048576 / self.workers)
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise JobCancelled("Processing cancelled")
+
     def process_batch(self, recto_files, verso_file, output_path, card_width=63.5,
                      card_height=88.0, bleed=2.5, dpi=300, reg_marks=True,
                      color_bars=True, progress_callback=None):
@@ -37,196 +218,885 @@ class PDFCreator:
             total_sheets = math.ceil(len(recto_files) / cards_per_sheet)
 
             print(f"\nProcessing {len(recto_files)} cards across {total_sheets} sheets")
-            generated_pdfs = []
+            self.failed_cards = []
+
+            # Drafts only read the small thumbnail near the start of each file
+            if self.prefetch_depth and not self.draft:
+                self.prefetcher = FilePrefetcher(
+                    self.prefetch_depth, self.prefetch_budget_mb,
+                    keep_data=not self.uses_decode_pool()
+                )
+                for sheet_num in range(total_sheets):
+                    start_idx = sheet_num * cards_per_sheet
+                    self.prefetcher.schedule(
+                        [source for source in recto_files[start_idx:start_idx + cards_per_sheet]
+                         if not getattr(source, 'layers', None)] + [verso_file]
+                    )
+            generated_sheets = [self.sheet_paths(sheet_num) for sheet_num in range(total_sheets)]
+
+            def render_sheet(sheet_num, sheet_files, sheet_pdfs, deferred):
+                self.create_sheet_pair(
+                    sheet_num,
+                    sheet_files,
+                    verso_file,
+                    card_width=card_width,
+                    card_height=card_height,
+                    bleed=bleed,
+                    dpi=dpi,
+                    reg_marks=reg_marks,
+                    color_bars=color_bars,
+                    deferred=deferred
+                )
 
             # Process each sheet
+            self.render_sheets(
+                recto_files, verso_file,
+                lambda sheet_num: generated_sheets[sheet_num],
+                render_sheet,
+                progress_callback=progress_callback
+            )
+
+            if progress_callback:
+                progress_callback(0.9, "Merging PDFs...")
+
+            self.write_output(generated_sheets, recto_files, output_path, cards_per_sheet)
+
+            self.finish_job(f"Complete! Created {total_sheets} sheets ({total_sheets*2} pages)",
+                            progress_callback)
+
+        except JobCancelled:
+            print("\nProcessing cancelled")
+            raise
+
+        except Exception as e:
+            print(f"Error in process_batch: {str(e)}")
+            raise
+
+        finally:
+            if self.prefetcher is not None:
+                print(f"Read-ahead: {self.prefetcher.hits} files read ahead, "
+                      f"{self.prefetcher.misses} read by the decoder")
+                self.prefetcher.close()
+                self.prefetcher = None
+
+    def render_sheets(self, recto_files, verso_file, sheet_outputs, render_sheet,
+                      progress_callback=None, progress_share=1.0, action="Processing"):
+        """
+        Render every sheet of a job in order, skipping sheets completed by an
+        interrupted run and checkpointing the ones rendered here
+        Args:
+            sheet_outputs: Returns the files a sheet number is written to
+            render_sheet: Writes them, called with (sheet_num, recto files, output files,
+                deferred). Sides waiting for a retried card may be added to the deferred
+                list instead of being saved, they are saved as soon as the retry is done
+            progress_share: Part of the progress bar taken by the sheets
+        """
+        cards_per_sheet = 9
+        total_sheets = math.ceil(len(recto_files) / cards_per_sheet)
+        # (sheet_num, signature, output files, deferred sides, rendered without placeholders)
+        pending = []
+
+        try:
             for sheet_num in range(total_sheets):
                 if progress_callback:
-                    progress = (sheet_num) / total_sheets
-                    message = f"Processing sheet {sheet_num + 1} of {total_sheets}"
-                    progress_callback(progress, message)
+                    progress_callback(sheet_num / total_sheets * progress_share,
+                                      f"{action} sheet {sheet_num + 1} of {total_sheets}")
 
                 # Calculate the range of cards for this sheet
                 start_idx = sheet_num * cards_per_sheet
                 end_idx = min(start_idx + cards_per_sheet, len(recto_files))
                 current_recto_files = recto_files[start_idx:end_idx]
+                output_files = list(sheet_outputs(sheet_num))
+
+                self.check_cancelled()
+
+                # Sheets finished by an interrupted run are reused as they are
+                signature = None
+                if self.journal is not None:
+                    signature = self.journal.sheet_signature(current_recto_files, verso_file)
+                    if self.journal.is_complete(sheet_num, signature, output_files):
+                        print(f"\nSheet {sheet_num + 1} of {total_sheets}: already completed")
+                        continue
 
                 print(f"\nSheet {sheet_num + 1} of {total_sheets}:")
                 print(f"Processing cards {start_idx + 1} to {end_idx}")
 
-                # Create recto sheet
-                recto_pdf = os.path.join(self.temp_dir, f"sheet_{sheet_num:03d}_recto.pdf")
-                self.create_sheet(
-                    current_recto_files,
-                    recto_pdf,
-                    card_width=card_width,
-                    card_height=card_height,
-                    bleed=bleed,
-                    dpi=dpi,
-                    is_verso=False,
-                    reg_marks=reg_marks,
-                    color_bars=color_bars
-                )
-                generated_pdfs.append(recto_pdf)
-
-                # Create verso sheet
-                verso_pdf = os.path.join(self.temp_dir, f"sheet_{sheet_num:03d}_verso.pdf")
-                verso_files = [verso_file] * len(current_recto_files)
-                self.create_sheet(
-                    verso_files,
-                    verso_pdf,
-                    card_width=card_width,
-                    card_height=card_height,
-                    bleed=bleed,
-                    dpi=dpi,
-                    is_verso=True,
-                    reg_marks=reg_marks,
-                    color_bars=color_bars
-                )
-                generated_pdfs.append(verso_pdf)
+                failed_before = len(self.failed_cards)
+                deferred = []
+                render_sheet(sheet_num, current_recto_files, output_files, deferred)
+                pending.append((sheet_num, signature, output_files, deferred,
+                                len(self.failed_cards) == failed_before))
 
-            if progress_callback:
-                progress_callback(0.9, "Merging PDFs...")
+                self.finish_deferred_sheets(pending)
 
+            self.finish_deferred_sheets(pending, wait=True)
+
+        finally:
+            # Retries of a cancelled or failed job are stopped and their slots returned
+            for _, _, _, deferred, _ in pending:
+                for sheet in deferred:
+                    for card in sheet.retried:
+                        self.release_retried_card(card)
+
+        # How the parallel decodes were throttled, in every output mode
+        if self.governor is not None:
+            print(self.governor.report())
+
+    def finish_deferred_sheets(self, pending, wait=False):
+        """
+        Save the deferred sides of rendered sheets whose retried cards are done (all of
+        them with wait) and checkpoint the sheets that are complete
+        """
+        for entry in list(pending):
+            sheet_num, signature, output_files, deferred, clean = entry
+            if not wait and not all(sheet.ready() for sheet in deferred):
+                continue
+
+            failed_before = len(self.failed_cards)
+            while deferred:
+                deferred[0].finish()
+                deferred.pop(0)
+            pending.remove(entry)
+
+            # Sheets with placeholders are rendered again when the job is resumed
+            if self.journal is not None and clean and len(self.failed_cards) == failed_before:
+                self.journal.mark_complete(sheet_num, signature, output_files)
+
+    def finish_job(self, message, progress_callback=None):
+        """Drop the checkpoints of a job whose output is complete and report on the run"""
+        if self.journal is not None:
+            self.journal.finish()
+
+        print(self.scratch.throughput_report())
+
+        if self.failed_cards:
+            print(self.failure_report())
+            message += f", {len(self.failed_cards)} cards replaced by placeholders"
+
+        if progress_callback:
+            progress_callback(1.0, message)
+
+    def failure_report(self):
+        """Return a summary of the cards that were replaced by placeholders"""
+        lines = [f"{len(self.failed_cards)} cards could not be decoded and were replaced by placeholders:"]
+        lines.extend(f"  {source}: {reason}" for source, reason in self.failed_cards)
+        return "\n".join(lines)
+
+    def write_output(self, generated_sheets, recto_files, output_path, cards_per_sheet=9):
+        """Merge the (recto, verso) sheet PDFs into the output file or shards"""
+        if self.sheets_per_shard:
+            # Shards are merged in parallel, the single file is optional
+            manifest_path = write_shards(
+                generated_sheets, recto_files, output_path, self.sheets_per_shard,
+                cards_per_sheet=cards_per_sheet
+            )
+            print(f"Shard manifest written to {manifest_path}")
+            if self.join_shards:
+                concatenate_shards(manifest_path, output_path)
+        else:
             # Merge all PDFs
-            self.merge_pdfs(generated_pdfs, output_path)
+            self.merge_pdfs([path for pair in generated_sheets for path in pair], output_path)
 
-            if progress_callback:
-                progress_callback(1.0, f"Complete! Created {total_sheets} sheets ({total_sheets*2} pages)")
+    def process_targets(self, recto_files, verso_file, targets, card_width=63.5,
+                        card_height=88.0, bleed=2.5, progress_callback=None):
+        """
+        Write the same deck to several OutputTargets (for example a review and a
+        press PDF) from a single decode pass. Every card is decoded once at the
+        highest target DPI and the verso once for the whole job
+        """
+        try:
+            recto_files = list(recto_files)
+            cards_per_sheet = 9
+            total_sheets = math.ceil(len(recto_files) / cards_per_sheet)
+            decode_dpi = max(target.dpi for target in targets)
+
+            print(f"\nProcessing {len(recto_files)} cards across {total_sheets} sheets "
+                  f"for {len(targets)} outputs")
+            self.failed_cards = []
+
+            # The verso is the same on every sheet
+            layout = self.get_layout(card_width, card_height, bleed)
+            verso_size = (int(layout.cell_width * decode_dpi / 25.4), int(layout.cell_height * decode_dpi / 25.4))
+            self.decoded_cache = DecodedImageCache()
+            if self.uses_decode_pool():
+                # Decoded in a worker under the same limits as every other card
+                images = self.load_sheet_images([verso_file], decode_dpi, verso_size)
+                try:
+                    verso_image = next(images).copy()
+                finally:
+                    images.close()
+                if len(self.failed_cards) == 0:
+                    self.decoded_cache.put(verso_file, verso_image)
+                else:
+                    # Left to each sheet, which then uses and reports the placeholder itself
+                    self.failed_cards = []
+            else:
+                self.decoded_cache.put(verso_file, self.handle_psd_file(verso_file, decode_dpi, verso_size))
+
+            # One (recto, verso) pair per sheet for each target
+            generated_sheets = [
+                [self.sheet_paths(sheet_num, f"target_{index:02d}_sheet") for sheet_num in range(total_sheets)]
+                for index in range(len(targets))
+            ]
+
+            def render_sheet(sheet_num, sheet_files, sheet_pdfs, deferred):
+                for is_verso, side_files in (
+                    (False, sheet_files),
+                    (True, [verso_file] * len(sheet_files))
+                ):
+                    outputs = [(target, generated_sheets[index][sheet_num][is_verso])
+                               for index, target in enumerate(targets)]
+                    self.create_sheet_targets(
+                        side_files, outputs,
+                        card_width=card_width, card_height=card_height, bleed=bleed,
+                        is_verso=is_verso, deferred=deferred
+                    )
+
+            self.render_sheets(
+                recto_files, verso_file,
+                lambda sheet_num: [path for sheets in generated_sheets for path in sheets[sheet_num]],
+                render_sheet,
+                progress_callback=progress_callback,
+                progress_share=0.9
+            )
+
+            for index, target in enumerate(targets):
+                if progress_callback:
+                    progress_callback(0.9 + 0.1 * index / len(targets),
+                                      f"Writing {os.path.basename(target.output_path)}...")
+                self.write_output(generated_sheets[index], recto_files, target.output_path, cards_per_sheet)
+
+            self.finish_job(f"Complete! Created {len(targets)} PDFs of {total_sheets} sheets",
+                            progress_callback)
+
+        except JobCancelled:
+            print("\nProcessing cancelled")
+            raise
 
         except Exception as e:
-            print(f"Error in process_batch: {str(e)}")
+            print(f"Error in process_targets: {str(e)}")
             raise
 
+        finally:
+            self.decoded_cache = None
+
+    def process_tiff(self, recto_files, verso_file, output_dir, card_width=63.5,
+                     card_height=88.0, bleed=2.5, dpi=300, reg_marks=True, color_bars=True,
+                     compression=COMPRESSION_NONE, progress_callback=None):
+        """Write every sheet side as an imposed RGB TIFF for direct-to-press workflows"""
+        try:
+            recto_files = list(recto_files)
+            cards_per_sheet = 9
+            total_sheets = math.ceil(len(recto_files) / cards_per_sheet)
+            os.makedirs(output_dir, exist_ok=True)
+
+            print(f"\nExporting {len(recto_files)} cards across {total_sheets} sheets as TIFF")
+            self.failed_cards = []
+
+            def render_sheet(sheet_num, sheet_files, sheet_tiffs, deferred):
+                # Strips are written top to bottom, so TIFF sides wait for retried cards
+                for sheet_tiff, side_files, is_verso in (
+                    (sheet_tiffs[0], sheet_files, False),
+                    (sheet_tiffs[1], [verso_file] * len(sheet_files), True)
+                ):
+                    self.check_cancelled()
+                    self.create_sheet_tiff(
+                        side_files,
+                        sheet_tiff,
+                        card_width=card_width,
+                        card_height=card_height,
+                        bleed=bleed,
+                        dpi=dpi,
+                        is_verso=is_verso,
+                        reg_marks=reg_marks,
+                        color_bars=color_bars,
+                        compression=compression
+                    )
+
+            # TIFFs are written straight to the output folder, one per sheet side
+            self.render_sheets(
+                recto_files, verso_file,
+                lambda sheet_num: [os.path.join(output_dir, f"sheet_{sheet_num + 1:03d}_{side}.tif")
+                                   for side in ("recto", "verso")],
+                render_sheet,
+                progress_callback=progress_callback,
+                action="Exporting"
+            )
+
+            self.finish_job(f"Complete! Created {total_sheets * 2} TIFF files", progress_callback)
+
+        except JobCancelled:
+            print("\nProcessing cancelled")
+            raise
+
+        except Exception as e:
+            print(f"Error in process_tiff: {str(e)}")
+            raise
+
+    def create_sheet_tiff(self, sheet_files, output_path, card_width=63.5, card_height=88.0,
+                          bleed=2.5, dpi=300, is_verso=False, reg_marks=True, color_bars=True,
+                          compression=COMPRESSION_NONE):
+        """Create a single sheet as a TIFF, composited in strips to bound memory"""
+        layout = self.get_layout(card_width, card_height, bleed)
+        target_size = (int(layout.cell_width * dpi / 25.4), int(layout.cell_height * dpi / 25.4))
+
+        sheet_files = list(sheet_files[:layout.cards_per_sheet])
+        images = self.load_sheet_images(sheet_files, dpi, target_size)
+
+        def placed_images():
+            for i, image in enumerate(images):
+                self.check_cancelled()
+                print(f"  Placing card {i+1} at position ({i // 3 + 1}, {i % 3 + 1})")
+                yield image
+
+        # Written under a temporary name so a cancelled sheet never looks complete
+        partial_path = output_path + ".partial"
+        try:
+            write_sheet_tiff(
+                layout, placed_images(), partial_path, dpi=dpi, is_verso=is_verso,
+                reg_marks=reg_marks, color_bars=color_bars, compression=compression
+            )
+            os.replace(partial_path, output_path)
+            print(f"  Wrote {os.path.basename(output_path)}")
+            return output_path
+
+        finally:
+            images.close()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def process_progressive(self, recto_files, verso_file, output_path, draft_path,
+                            draft_dpi=72, card_width=63.5, card_height=88.0, bleed=2.5,
+                            dpi=300, reg_marks=True, color_bars=True,
+                            draft_callback=None, progress_callback=None):
+        """
+        Write a quick low resolution draft PDF for checking the layout, then the press PDF.
+        The draft decodes cheaply (embedded PSD thumbnails, reduced JPEG decoding) and
+        keeps any full PSD decodes it had to make for the press pass
+        """
+        journal = self.journal
+        sheets_per_shard = self.sheets_per_shard
+        self.decoded_cache = DecodedImageCache()
+
+        try:
+            # The draft is never checkpointed or split
+            self.draft = True
+            self.journal = None
+            self.sheets_per_shard = None
+
+            start = time.perf_counter()
+            self.process_batch(
+                recto_files, verso_file, draft_path,
+                card_width=card_width, card_height=card_height, bleed=bleed,
+                dpi=draft_dpi, reg_marks=reg_marks, color_bars=color_bars,
+                progress_callback=draft_callback
+            )
+            print(f"Draft proof written to {draft_path} in {time.perf_counter() - start:.1f}s")
+
+            self.draft = False
+            self.journal = journal
+            self.sheets_per_shard = sheets_per_shard
+
+            self.process_batch(
+                recto_files, verso_file, output_path,
+                card_width=card_width, card_height=card_height, bleed=bleed,
+                dpi=dpi, reg_marks=reg_marks, color_bars=color_bars,
+                progress_callback=progress_callback
+            )
+
+        finally:
+            self.draft = False
+            self.journal = journal
+            self.sheets_per_shard = sheets_per_shard
+            self.decoded_cache = None
+
+    def sheet_paths(self, sheet_num, prefix="sheet"):
+        """Return the recto and verso PDF paths of a sheet"""
+        # Checkpointed jobs keep their sheets in the journal directory so they survive a crash
+        directory = self.journal.directory if self.journal is not None else self.temp_dir
+        return (
+            os.path.join(directory, f"{prefix}_{sheet_num:03d}_recto.pdf"),
+            os.path.join(directory, f"{prefix}_{sheet_num:03d}_verso.pdf")
+        )
+
+    def create_sheet_pair(self, sheet_num, recto_files, verso_file, card_width=63.5,
+                          card_height=88.0, bleed=2.5, dpi=300, reg_marks=True,
+                          color_bars=True, deferred=None):
+        """Create the recto and verso PDFs for one sheet and return both paths"""
+        recto_pdf, verso_pdf = self.sheet_paths(sheet_num)
+
+        # Create recto sheet
+        self.create_sheet(
+            recto_files,
+            recto_pdf,
+            card_width=card_width,
+            card_height=card_height,
+            bleed=bleed,
+            dpi=dpi,
+            is_verso=False,
+            reg_marks=reg_marks,
+            color_bars=color_bars,
+            deferred=deferred
+        )
+
+        # Create verso sheet
+        verso_files = [verso_file] * len(recto_files)
+        self.create_sheet(
+            verso_files,
+            verso_pdf,
+            card_width=card_width,
+            card_height=card_height,
+            bleed=bleed,
+            dpi=dpi,
+            is_verso=True,
+            reg_marks=reg_marks,
+            color_bars=color_bars,
+            deferred=deferred
+        )
+
+        return recto_pdf, verso_pdf
+
+    def get_layout(self, card_width=63.5, card_height=88.0, bleed=2.5):
+        """Return the sheet layout shared by the PDF and raster previews"""
+        return SheetLayout(self.width_mm, self.height_mm, card_width, card_height, bleed)
+
     def create_sheet(self, sheet_files, output_path, card_width=63.5, card_height=88.0,
-                    bleed=2.5, dpi=300, is_verso=False, reg_marks=True, color_bars=True):
+                    bleed=2.5, dpi=300, is_verso=False, reg_marks=True, color_bars=True,
+                    deferred=None):
         """Create a single sheet of cards in a 3x3 grid"""
+        target = OutputTarget(output_path, dpi, self.optimize, reg_marks, color_bars)
+        self.create_sheet_targets(
+            sheet_files, [(target, output_path)],
+            card_width=card_width, card_height=card_height, bleed=bleed, is_verso=is_verso,
+            deferred=deferred
+        )
+        return output_path
+
+    def create_sheet_targets(self, sheet_files, outputs, card_width=63.5, card_height=88.0,
+                             bleed=2.5, is_verso=False, deferred=None):
+        """
+        Create one sheet for several output targets, decoding each card once
+        Args:
+            sheet_files: Card files of the sheet (at most 9)
+            outputs: (OutputTarget, sheet PDF path) pairs
+            deferred: List that receives a DeferredSheet instead of waiting when a card
+                is being retried (None waits for the retry)
+        """
+        retried = {}
+        handed_over = False
         try:
             # Fixed 3x3 grid size
             grid_size = 3
 
             # Calculate grid dimensions
-            total_grid_width = grid_size * (card_width + 2 * bleed)
-            total_grid_height = grid_size * (card_height + 2 * bleed)
-            margin_x = (self.width_mm - total_grid_width) / 2
-            margin_y = (self.height_mm - total_grid_height) / 2
-
-            # Create new PDF document
-            c = canvas.Canvas(output_path, pagesize=A4)
-
-            # Process each card position (maximum 9 cards)
-            for i, psd_file in enumerate(sheet_files[:grid_size * grid_size]):
-                row = i // grid_size
-                col = i % grid_size
-
-                if is_verso:
-                    # Mirror positions for verso side
-                    x = self.width_mm - (margin_x + (col * (card_width + 2 * bleed)) + (card_width + 2 * bleed))
-                    y = self.height_mm - (margin_y + (row * (card_height + 2 * bleed)) + (card_height + 2 * bleed))
-                else:
-                    x = margin_x + (col * (card_width + 2 * bleed))
-                    y = self.height_mm - (margin_y + (row * (card_height + 2 * bleed)) + (card_height + 2 * bleed))
-
-                print(f"  Placing card {i+1} at position ({row+1}, {col+1})")
-
-                # Process and place image
-                image = self.handle_psd_file(psd_file, dpi)
-                self.place_image(
-                    c, image, x, y,
-                    card_width + 2 * bleed,
-                    card_height + 2 * bleed,
-                    dpi
-                )
-
-            # Add cut lines and marks
-            self.add_cut_lines(
-                c, margin_x, margin_y,
-                total_grid_width, total_grid_height,
-                card_width, card_height,
-                grid_size, bleed
+            layout = self.get_layout(card_width, card_height, bleed)
+            total_grid_width = layout.grid_width
+            total_grid_height = layout.grid_height
+            margin_x = layout.margin_x
+            margin_y = layout.margin_y
+
+            # Cards are decoded for the sharpest target, the others are resized from it
+            decode_dpi = max(target.dpi for target, _ in outputs)
+            target_size = (
+                int((card_width + 2 * bleed) * decode_dpi / 25.4),
+                int((card_height + 2 * bleed) * decode_dpi / 25.4)
             )
 
-            if reg_marks:
-                self.add_registration_marks(
-                    c, margin_x, margin_y,
-                    total_grid_width, total_grid_height
-                )
+            # Create new PDF documents
+            canvases = [canvas.Canvas(output_path, pagesize=A4) for _, output_path in outputs]
+
+            def place_card(image, x, y):
+                # Place a decoded image on every target
+                for (target, _), c in zip(outputs, canvases):
+                    self.place_image(
+                        c, image, x, y,
+                        card_width + 2 * bleed,
+                        card_height + 2 * bleed,
+                        target.dpi,
+                        target.optimize
+                    )
 
-            if color_bars:
-                self.add_color_bars(
-                    c, margin_x, margin_y - 10,
-                    total_grid_width
-                )
+            # Decoding runs ahead of placement when parallel workers are enabled
+            sheet_files = list(sheet_files[:grid_size * grid_size])
+            images = self.load_sheet_images(sheet_files, decode_dpi, target_size,
+                                            defer_retries=deferred is not None)
+
+            try:
+                # Process each card position (maximum 9 cards)
+                for i, psd_file in enumerate(sheet_files):
+                    row = i // grid_size
+                    col = i % grid_size
+
+                    x, y = layout.card_position(i, is_verso)
+
+                    self.check_cancelled()
+
+                    image = next(images)
+                    if isinstance(image, RetriedCard):
+                        # Placed when its retry is done, the other cards go on meanwhile
+                        print(f"  Card {i+1} at position ({row+1}, {col+1}) waits for its retry")
+                        retried.setdefault(image, []).append((x, y))
+                        continue
+
+                    print(f"  Placing card {i+1} at position ({row+1}, {col+1})")
+                    place_card(image, x, y)
+
+            finally:
+                # Drop the last card and hand the spool slots back before a cancel tears down the pool
+                image = None
+                images.close()
+
+            def finish():
+                for card, positions in retried.items():
+                    image = self.take_retried_card(card)
+                    try:
+                        for x, y in positions:
+                            place_card(image, x, y)
+                    finally:
+                        image = None
+                        self.release_retried_card(card)
+
+                for (target, output_path), c in zip(outputs, canvases):
+                    # Add cut lines and marks
+                    self.add_cut_lines(
+                        c, margin_x, margin_y,
+                        total_grid_width, total_grid_height,
+                        card_width, card_height,
+                        grid_size, bleed
+                    )
 
-            c.showPage()
-            c.save()
-            return output_path
+                    if target.reg_marks:
+                        self.add_registration_marks(
+                            c, margin_x, margin_y,
+                            total_grid_width, total_grid_height
+                        )
+
+                    if target.color_bars:
+                        self.add_color_bars(
+                            c, margin_x, margin_y - 10,
+                            total_grid_width
+                        )
+
+                    c.showPage()
+                    start = time.perf_counter()
+                    c.save()
+
+                    # Sheets stay in scratch until the merge and count towards its quota
+                    if self.scratch.contains(output_path):
+                        self.scratch.record_write(os.path.getsize(output_path), time.perf_counter() - start)
+                        self.scratch.add_file(output_path)
+
+            if retried and deferred is not None:
+                # Saved by the sheet loop once the retries are done
+                deferred.append(DeferredSheet(retried, finish))
+                handed_over = True
+            else:
+                finish()
+
+            return [output_path for _, output_path in outputs]
+
+        except JobCancelled:
+            raise
 
         except Exception as e:
             print(f"Error creating sheet: {str(e)}")
             raise
 
-    def handle_psd_file(self, psd_path, target_dpi):
-        """Process a PSD file and return a PIL Image"""
-        try:
-            psd = PSDImage.open(psd_path)
-            image = psd.topil()
+        finally:
+            # Retries of a sheet that was not completed are stopped
+            if not handed_over:
+                for card in retried:
+                    self.release_retried_card(card)
 
-            if image is None:
-                raise ValueError(f"Could not process PSD file: {psd_path}")
+    def handle_psd_file(self, psd_path, target_dpi, target_size=None):
+        """Load a PSD or pre-rendered image file and return a PIL Image"""
+        try:
+            # Decoded by the draft pass of a progressive job
+            if self.decoded_cache is not None:
+                image = self.decoded_cache.get(psd_path)
+                if image is not None:
+                    return image
 
-            # Convert to RGB if necessary
-            if image.mode in ['RGBA', 'LA'] or (image.mode == 'P' and 'transparency' in image.info):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'RGBA':
-                    background.paste(image, mask=image.split()[3])
-                else:
-                    background.paste(image, mask=image.split()[1])
-                image = background
-            elif image.mode == 'CMYK':
-                image = image.convert('RGB')
+            # Layer-selecting cards reuse their cached master document instead
+            data = None
+            if (self.prefetcher is not None and self.prefetcher.keep_data
+                    and not getattr(psd_path, 'layers', None)):
+                data = self.prefetcher.get(psd_path)
 
-            return image
+            return load_image(psd_path, target_size, data)
 
         except Exception as e:
             raise ValueError(f"Error processing {os.path.basename(psd_path)}: {str(e)}")
 
-    def place_image(self, canvas, image, x, y, width, height, target_dpi):
+    def handle_draft_file(self, psd_path, target_size):
+        """Decode a card as cheaply as possible for a draft proof"""
+        thumbnail = read_draft_thumbnail(psd_path)
+        if thumbnail is not None:
+            return thumbnail
+
+        # JPEGs decode at a reduced size, PSDs without a thumbnail are kept for the press pass
+        loader = get_loader(psd_path)
+        image = self.handle_psd_file(psd_path, None, target_size if loader is FLAT_LOADER else None)
+        if loader is not FLAT_LOADER:
+            self.decoded_cache.put(psd_path, image)
+        return image
+
+    def load_sheet_images(self, sheet_files, dpi, target_size, defer_retries=False):
+        """
+        Yield the decoded image for each card in order
+        Args:
+            defer_retries: Yield a RetriedCard for a card whose first decode failed instead
+                of waiting for the retry, the caller places it later
+        """
+        # Isolated drafts are decoded by the workers too, a bad file must not stop the app
+        if self.draft and not self.isolate:
+            for psd_file, group in itertools.groupby(sheet_files):
+                image = self.handle_draft_file(psd_file, target_size)
+                for _ in group:
+                    yield image
+            return
+
+        if not self.uses_decode_pool():
+            # Repeated cards in a row (the verso) are decoded once
+            for psd_file, group in itertools.groupby(sheet_files):
+                image = self.handle_psd_file(psd_file, dpi, target_size)
+                for _ in group:
+                    yield image
+            return
+
+        spool = self.get_raster_spool(target_size)
+
+        # Repeated cards in a row (the verso) are decoded once and share a slot
+        runs = [(source, len(list(group))) for source, group in itertools.groupby(sheet_files)]
+        in_flight = deque()
+        next_run = 0
+
+        def submit(source, slot, cost, fresh_worker=False):
+            # Read ahead into the page cache, in the order the workers open the files
+            if self.prefetcher is not None and not fresh_worker and not getattr(source, 'layers', None):
+                self.prefetcher.handed_over(source)
+            future = self.decode_pool.submit(
+                decode_card_to_slot,
+                spool.slot_name(slot),
+                spool.slot_size,
+                source,
+                target_size,
+                self.draft,
+                fresh_worker=fresh_worker
+            )
+            future.add_done_callback(
+                lambda future, cost=cost: self.decode_finished(future, cost)
+            )
+            return future
+
+        try:
+            for index, (source, count) in enumerate(runs):
+                # Submit in card order, blocking only for the card needed next
+                while next_run < len(runs):
+                    # Cards decoded by a draft pass need no worker
+                    cached = None
+                    if self.decoded_cache is not None:
+                        cached = self.decoded_cache.get(runs[next_run][0])
+                    if cached is not None:
+                        in_flight.append((cached, None))
+                        next_run += 1
+                        continue
+
+                    # Look-ahead decodes also need room in the governor's memory budget
+                    cost = self.governor.estimate(runs[next_run][0])
+                    if next_run == index:
+                        slot = spool.acquire()
+                        self.governor.try_admit(cost, required=True)
+                    else:
+                        try:
+                            slot = spool.acquire(block=False)
+                        except queue.Empty:
+                            break
+                        if not self.governor.try_admit(cost):
+                            spool.release(slot)
+                            break
+
+                    in_flight.append((submit(runs[next_run][0], slot, cost), slot))
+                    next_run += 1
+
+                future, slot = in_flight.popleft()
+                if slot is None:
+                    for _ in range(count):
+                        yield future
+                    continue
+
+                name = os.path.basename(source)
+                try:
+                    size, _, _ = future.result()
+                except Exception as e:
+                    if not self.isolate:
+                        spool.release(slot)
+                        raise
+                    size = None
+                    print(f"  Decode of {name} failed ({str(e)}), retrying in a fresh worker")
+
+                if size is None:
+                    # Retried once in a process of its own, a second failure gives a placeholder
+                    cost = self.governor.estimate(source)
+                    self.governor.try_admit(cost, required=True)
+                    retry = RetriedCard(source, submit(source, slot, cost, fresh_worker=True),
+                                        spool, slot, target_size)
+                    # At least one slot stays with the writer, or it would wait for itself
+                    if defer_retries and self.background_retries < len(spool.slots) - 1:
+                        # The caller owns the slot now and places the card when the retry is done
+                        retry.background = True
+                        self.background_retries += 1
+                        for _ in range(count):
+                            yield retry
+                        continue
+
+                    image = self.take_retried_card(retry)
+                    try:
+                        for _ in range(count):
+                            yield image
+                    finally:
+                        del image
+                        self.release_retried_card(retry)
+                    continue
+
+                # The image reads straight from shared memory, no copy is made
+                image = spool.read_image(slot, size)
+                try:
+                    for _ in range(count):
+                        yield image
+                finally:
+                    # Also reached when the caller closes the generator after the last card
+                    del image
+                    spool.release(slot)
+
+        finally:
+            # Abandoned decodes must stop writing before their slots go back into the ring
+            for future, slot in in_flight:
+                if slot is None:
+                    continue
+                if self.decode_pool is None:
+                    # Already shut down, which stopped its workers
+                    pass
+                elif self.isolate:
+                    # A hung decode is not waited for
+                    self.decode_pool.abort(future)
+                else:
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+                spool.release(slot)
+
+    def take_retried_card(self, card):
+        """Wait for a retried decode and return its image, or a placeholder if it failed again"""
+        try:
+            size, _, _ = card.future.result()
+        except Exception as e:
+            self.failed_cards.append((card.name, str(e)))
+            print(f"  Decode of {card.name} failed again, using a placeholder")
+            return make_placeholder_card(card.target_size, card.name, str(e))
+
+        # The image reads straight from shared memory, no copy is made
+        return card.spool.read_image(card.slot, size)
+
+    def release_retried_card(self, card):
+        """Stop a retried decode if it is still running and return its spool slot"""
+        if card.slot is None:
+            return
+        if not card.future.done() and self.decode_pool is not None:
+            self.decode_pool.abort(card.future)
+        card.spool.release(card.slot)
+        card.slot = None
+        if card.background:
+            self.background_retries -= 1
+
+    def decode_finished(self, future, cost):
+        """Report a finished worker decode to the resource governor"""
+        if future.cancelled() or future.exception() is not None:
+            self.governor.complete(cost)
+        else:
+            _, worker_pid, worker_rss = future.result()
+            self.governor.complete(cost, worker_pid, worker_rss)
+
+    def get_raster_spool(self, target_size):
+        """Return the decode pool's raster spool, sized for the given card size"""
+        slot_size = target_size[0] * target_size[1] * SPOOL_BYTES_PER_PIXEL
+
+        if self.raster_spool is None or self.raster_spool.slot_size < slot_size:
+            self.close_decode_pool()
+            # Resident memory reported by the old workers no longer applies
+            self.governor = ResourceGovernor(self.workers, self.memory_budget_mb)
+            # Spawned workers stay clear of the GUI thread's state, limits only apply when isolating
+            self.decode_pool = IsolatedWorkerPool(
+                self.workers,
+                timeout=self.decode_timeout if self.isolate else None,
+                memory_limit_mb=self.worker_memory_limit_mb() if self.isolate else None,
+                on_worker_exit=self.governor.forget_worker
+            )
+            self.raster_spool = RasterSpool(self.workers * 2, slot_size)
+
+        return self.raster_spool
+
+    def close_decode_pool(self):
+        """Stop decode workers and free the raster spool"""
+        if self.decode_pool is not None:
+            self.decode_pool.shutdown(wait=True, cancel_futures=True)
+            self.decode_pool = None
+
+        if self.raster_spool is not None:
+            self.raster_spool.close()
+            self.raster_spool = None
+
+    def place_image(self, canvas, image, x, y, width, height, target_dpi, optimize=None):
         """Place an image on the PDF canvas with proper scaling"""
         try:
+            if optimize is None:
+                optimize = self.optimize
+
             # Calculate target size in pixels
             target_width = int(width * target_dpi / 25.4)  # mm to inches * dpi
             target_height = int(height * target_dpi / 25.4)
 
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                # Resize image if needed
-                if image.size != (target_width, target_height):
-                    image = image.resize(
-                        (target_width, target_height),
-                        Image.Resampling.LANCZOS
-                    )
+            # Resize image if needed
+            if image.size != (target_width, target_height):
+                image = image.resize(
+                    (target_width, target_height),
+                    Image.Resampling.LANCZOS
+                )
 
+            # Create temporary file in scratch space
+            reserved = self.scratch.reserve(target_width * target_height * 3 // 2)
+            tmp_path = self.scratch.new_file(suffix='.jpg')
+            try:
                 # Save with appropriate quality
-                quality = 95 if self.optimize else 100
+                quality = 95 if optimize else 100
+                start = time.perf_counter()
                 image.save(
-                    tmp_file.name,
+                    tmp_path,
                     'JPEG',
                     quality=quality,
                     dpi=(target_dpi, target_dpi)
                 )
+                size = os.path.getsize(tmp_path)
+                self.scratch.record_write(size, time.perf_counter() - start)
+                self.scratch.add_file(tmp_path, reserved)
+                reserved = 0
 
-                # Place image
+                # Place image, the canvas reads the JPEG data here
+                start = time.perf_counter()
                 canvas.drawImage(
-                    tmp_file.name,
+                    tmp_path,
                     x * mm,
                     y * mm,
                     width=width * mm,
                     height=height * mm
                 )
+                self.scratch.record_read(size, time.perf_counter() - start)
 
-            # Clean up
-            os.unlink(tmp_file.name)
+            finally:
+                # Clean up
+                self.scratch.cancel_reservation(reserved)
+                self.scratch.remove_file(tmp_path)
 
         except Exception as e:
             raise Exception(f"Error placing image: {str(e)}")
@@ -356,6 +1226,7 @@ class PDFCreator:
     def merge_pdfs(self, pdf_files, output_path):
         """Merge multiple PDF files into one"""
         try:
+            start = time.perf_counter()
             merger = PdfMerger()
 
             # Sort files to ensure correct order
@@ -374,15 +1245,20 @@ class PDFCreator:
 
             merger.close()
 
+            # The merge reads every intermediate sheet back
+            self.scratch.record_read(
+                sum(os.path.getsize(pdf_file) for pdf_file in sorted_files
+                    if self.scratch.contains(pdf_file) and os.path.exists(pdf_file)),
+                time.perf_counter() - start
+            )
+
         except Exception as e:
             raise Exception(f"Error merging PDFs: {str(e)}")
 
     def cleanup(self):
         """Clean up temporary files"""
-        try:
-            shutil.rmtree(self.temp_dir)
-        except Exception as e:
-            print(f"Warning: Could not clean up temporary directory: {str(e)}")
+        self.close_decode_pool()
+        self.scratch.cleanup()
 
 class PDFHelper:
     @staticmethod
@@ -444,27 +1320,9 @@ class PDFHelper:
 
     @staticmethod
     def process_psd(psd_path):
-        """Process a PSD file and return a PIL Image"""
+        """Process a PSD or pre-rendered image file and return a PIL Image"""
         try:
-            psd = PSDImage.open(psd_path)
-            image = psd.topil()
-
-            if image is None:
-                raise ValueError(f"Could not process PSD file: {psd_path}")
-
-            # Convert to RGB if necessary
-            if image.mode in ['RGBA', 'LA'] or (image.mode == 'P' and 'transparency' in image.info):
-                # Create white background for transparency
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'RGBA':
-                    background.paste(image, mask=image.split()[3])
-                else:
-                    background.paste(image, mask=image.split()[1])
-                image = background
-            elif image.mode == 'CMYK':
-                image = image.convert('RGB')
-
-            return image
+            return load_image(psd_path)
 
         except Exception as e:
-            raise ValueError(f"Error processing {os.path.basename(psd_path)}: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Error processing {os.path.basename(psd_path)}: {str(e)}")
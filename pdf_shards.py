@@ -0,0 +1,119 @@
+# pdf_shards.py
+import os
+import sys
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfMerger
+
+MANIFEST_SUFFIX = "_manifest.json"
+
+def merge_shard(pdf_files, output_path):
+    """
+    Merge the sheet PDFs of one shard into a standalone file, runs in a worker
+    Returns:
+        tuple: (page count, size in bytes, sha256 of the file)
+    """
+    merger = PdfMerger()
+    for pdf_file in pdf_files:
+        merger.append(pdf_file)
+
+    # Written under a temporary name so a crash never leaves a half shard behind
+    partial_path = output_path + ".partial"
+    with open(partial_path, 'wb') as output_file:
+        merger.write(output_file)
+    pages = len(merger.pages)
+    merger.close()
+    os.replace(partial_path, output_path)
+
+    digest = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return pages, os.path.getsize(output_path), digest.hexdigest()
+
+def manifest_path_for(output_path):
+    """Return the manifest path that belongs to an output PDF"""
+    return os.path.splitext(output_path)[0] + MANIFEST_SUFFIX
+
+def write_shards(sheet_pdfs, recto_files, output_path, sheets_per_shard, cards_per_sheet=9, workers=None):
+    """
+    Write the sheets as several standalone PDFs of sheets_per_shard sheets each,
+    merged in parallel, plus a JSON manifest describing every shard
+    Args:
+        sheet_pdfs: (recto, verso) PDF pairs in sheet order
+        recto_files: Recto cards in deck order
+        output_path: Path of the single PDF, shards are named after it
+        sheets_per_shard: Number of sheets in each shard
+    Returns:
+        str: Path of the manifest
+    """
+    base, extension = os.path.splitext(output_path)
+    shards = []
+    for shard_num, start in enumerate(range(0, len(sheet_pdfs), sheets_per_shard)):
+        end = min(start + sheets_per_shard, len(sheet_pdfs))
+        shards.append({
+            'file': f"{base}_part{shard_num + 1:03d}{extension}",
+            'sheets': [start + 1, end],
+            'cards': [start * cards_per_sheet + 1, min(end * cards_per_sheet, len(recto_files))],
+            'pdfs': [path for pair in sheet_pdfs[start:end] for path in pair]
+        })
+
+    workers = max(1, min(len(shards), workers or os.cpu_count() or 1))
+    print(f"Writing {len(shards)} shards with {workers} processes")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(merge_shard, shard['pdfs'], shard['file']) for shard in shards]
+        for shard, future in zip(shards, futures):
+            shard['pages'], shard['size'], shard['sha256'] = future.result()
+            print(f"  {os.path.basename(shard['file'])}: sheets {shard['sheets'][0]}-{shard['sheets'][1]}, "
+                  f"{shard['size'] / 1048576:.1f} MB")
+
+    manifest = {
+        'sheets': len(sheet_pdfs),
+        'cards': len(recto_files),
+        'shards': [
+            {
+                'file': os.path.basename(shard['file']),
+                'sheets': shard['sheets'],
+                'cards': shard['cards'],
+                'card_files': [str(source) if not isinstance(source, str) else os.path.basename(source)
+                               for source in recto_files[shard['cards'][0] - 1:shard['cards'][1]]],
+                'pages': shard['pages'],
+                'size': shard['size'],
+                'sha256': shard['sha256']
+            }
+            for shard in shards
+        ]
+    }
+
+    manifest_path = manifest_path_for(output_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest_path
+
+def concatenate_shards(manifest_path, output_path):
+    """
+    Join the shards listed in a manifest into one PDF. Pages are copied with
+    their image streams as they are, nothing is decoded or re-compressed
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    merger = PdfMerger()
+    for shard in manifest['shards']:
+        merger.append(os.path.join(directory, shard['file']))
+
+    with open(output_path, 'wb') as output_file:
+        merger.write(output_file)
+    merger.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python pdf_shards.py cards_manifest.json cards.pdf")
+        sys.exit(1)
+    concatenate_shards(sys.argv[1], sys.argv[2])
@@ -0,0 +1,177 @@
+# preflight.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from image_loaders import read_image_info
+
+def source_name(source):
+    """Return the label for an input, naming the layers of a DeckCard variant"""
+    if getattr(source, 'layers', None):
+        return str(source)
+    return os.path.basename(source)
+
+class PreflightResult:
+    """Outcome of checking a single input file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = source_name(path)
+        self.header = None
+        self.errors = []
+        self.warnings = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def format(self):
+        """Return a one-line-per-issue description of this file"""
+        if self.header:
+            info = (f"{self.header['width']}x{self.header['height']}px, "
+                    f"{self.header['color_mode']} {self.header['depth']}-bit")
+        else:
+            info = "unreadable"
+
+        lines = [f"{self.name}: {info}"]
+        lines.extend(f"  ERROR: {message}" for message in self.errors)
+        lines.extend(f"  Warning: {message}" for message in self.warnings)
+        return "\n".join(lines)
+
+class PreflightReport:
+    """Collected pre-flight results for a deck"""
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result.errors]
+
+    @property
+    def warnings(self):
+        return [result for result in self.results if result.warnings]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def summary(self):
+        """Return a short summary line"""
+        return (f"Pre-flight: {len(self.results)} files checked, "
+                f"{len(self.errors)} with errors, {len(self.warnings)} with warnings")
+
+    def format(self):
+        """Return the full report listing every file with issues"""
+        lines = [self.summary()]
+        for result in self.results:
+            if result.errors or result.warnings:
+                lines.append(result.format())
+        return "\n".join(lines)
+
+class PreflightChecker:
+    """Fast header-only validation of a deck before any heavy processing starts"""
+
+    SUPPORTED_MODES = ("RGB", "CMYK", "Grayscale")
+
+    def __init__(self, card_width=63.5, card_height=88.0, bleed=2.5, dpi=300,
+                 tolerance_percent=5, max_workers=None, unreadable_is_warning=False):
+        """
+        Args:
+            unreadable_is_warning: Report unreadable headers as warnings, for jobs
+                that replace cards they cannot decode with placeholders
+        """
+        self.card_width = card_width
+        self.card_height = card_height
+        self.bleed = bleed
+        self.dpi = dpi
+        self.tolerance = tolerance_percent / 100
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.unreadable_is_warning = unreadable_is_warning
+
+    def expected_size(self):
+        """Return the expected (width, height) in pixels at the target DPI"""
+        width_mm = self.card_width + 2 * self.bleed
+        height_mm = self.card_height + 2 * self.bleed
+        return (round(width_mm * self.dpi / 25.4), round(height_mm * self.dpi / 25.4))
+
+    def check_file(self, path):
+        """Check a single file and return a PreflightResult"""
+        result = PreflightResult(path)
+
+        try:
+            header = read_image_info(path)
+        except Exception as e:
+            if self.unreadable_is_warning:
+                result.warnings.append(f"Could not read header: {str(e)}, a placeholder is used "
+                                       f"if the card cannot be decoded")
+            else:
+                result.errors.append(f"Could not read header: {str(e)}")
+            return result
+
+        result.header = header
+        width, height = header['width'], header['height']
+        expected_width, expected_height = self.expected_size()
+
+        if width == 0 or height == 0:
+            result.errors.append("Image has no pixels")
+            return result
+
+        # A different aspect ratio would distort the card when it is fitted
+        aspect = width / height
+        expected_aspect = expected_width / expected_height
+        if abs(aspect - expected_aspect) / expected_aspect > self.tolerance:
+            result.errors.append(
+                f"Aspect ratio {aspect:.3f} does not match card with bleed "
+                f"({expected_aspect:.3f}); check card size and bleed"
+            )
+        elif width < expected_width * (1 - self.tolerance):
+            result.warnings.append(
+                f"Resolution too low for {self.dpi} DPI "
+                f"({width}x{height}px, expected {expected_width}x{expected_height}px), "
+                f"will be upscaled"
+            )
+
+        if header['dpi']:
+            # Compare the document's physical size against card + bleed
+            h_dpi, v_dpi = header['dpi']
+            if h_dpi > 0 and v_dpi > 0:
+                width_mm = width / h_dpi * 25.4
+                height_mm = height / v_dpi * 25.4
+                expected_width_mm = self.card_width + 2 * self.bleed
+                expected_height_mm = self.card_height + 2 * self.bleed
+                if (abs(width_mm - expected_width_mm) > expected_width_mm * self.tolerance
+                        or abs(height_mm - expected_height_mm) > expected_height_mm * self.tolerance):
+                    result.warnings.append(
+                        f"Document size {width_mm:.1f}x{height_mm:.1f}mm at {h_dpi:.0f} DPI, "
+                        f"expected {expected_width_mm:.1f}x{expected_height_mm:.1f}mm"
+                    )
+
+        if header['color_mode'] not in self.SUPPORTED_MODES:
+            result.warnings.append(f"Colour mode {header['color_mode']} may not convert correctly")
+
+        if header['depth'] > 8:
+            result.warnings.append(f"{header['depth']}-bit channels will be scaled down to 8-bit")
+        elif header['depth'] < 8:
+            result.warnings.append(f"{header['depth']}-bit channels will be expanded to 8-bit")
+
+        return result
+
+    def run(self, files, progress_callback=None):
+        """Check all files in parallel and return a PreflightReport"""
+        # The verso file is usually repeated and layer variants share their master PSD,
+        # headers are read once per source file
+        sources = {}
+        for file in files:
+            sources.setdefault(os.path.abspath(os.fspath(file)), []).append(file)
+        results = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            checked = executor.map(self.check_file, (entries[0] for entries in sources.values()))
+            for i, (result, entries) in enumerate(zip(checked, sources.values())):
+                # Findings are reported under every variant that uses the file
+                result.name = ", ".join(dict.fromkeys(source_name(entry) for entry in entries))
+                results.append(result)
+                if progress_callback:
+                    progress_callback((i + 1) / len(sources), f"Pre-flight: {result.name}")
+
+        return PreflightReport(results)
@@ -4,46 +4,208 @@ from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 from psd_tools import PSDImage
 import os
+import math
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from image_loaders import PSD_LOADER, THUMBNAIL_CACHE, get_loader, load_image, read_image_info
+from image_pyramid import ImagePyramid
+from sheet_layout import render_sheet_image
 
 class PreviewWindow(ctk.CTkToplevel):
+    ZOOM_LEVELS = ["Fit", "10%", "25%", "50%", "75%", "100%", "200%", "400%"]
+
+    def __init__(self, parent, psd_path, title="PSD Preview"):
+        super().__init__(parent)
+
+        self.title(f"{title} - {os.path.basename(psd_path)}")
+        self.geometry("900x800")
+        self.psd_path = psd_path
+        self.psd = None
+        self.image = None
+        self.pyramid = None
+        self.zoom = 1.0
+
+        # Tiles currently drawn on the canvas: {(column, row): (item, photo)}
+        self.drawn_tiles = {}
+        self.render_pending = False
+
+        self.transient(parent)
+
+        self.setup_ui()
+        self.load_psd()
+
+    def setup_ui(self):
+        # Controls frame
+        self.controls_frame = ctk.CTkFrame(self)
+        self.controls_frame.pack(fill="x", padx=10, pady=(10, 5))
+
+        zoom_label = ctk.CTkLabel(self.controls_frame, text="Zoom:")
+        zoom_label.pack(side="left", padx=5)
+
+        self.zoom_var = ctk.StringVar(value="Fit")
+        zoom_menu = ctk.CTkOptionMenu(
+            self.controls_frame,
+            values=self.ZOOM_LEVELS,
+            variable=self.zoom_var,
+            command=self.update_preview
+        )
+        zoom_menu.pack(side="left", padx=5)
+
+        self.info_label = ctk.CTkLabel(self.controls_frame, text="")
+        self.info_label.pack(side="left", padx=10)
+
+        # Canvas with scrollbars
+        canvas_frame = ctk.CTkFrame(self)
+        canvas_frame.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        canvas_frame.grid_rowconfigure(0, weight=1)
+        canvas_frame.grid_columnconfigure(0, weight=1)
+
+        self.canvas = ctk.CTkCanvas(canvas_frame, bg="#2b2b2b", highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+
+        y_scrollbar = ctk.CTkScrollbar(canvas_frame, orientation="vertical", command=self.scroll_y)
+        y_scrollbar.grid(row=0, column=1, sticky="ns")
+        x_scrollbar = ctk.CTkScrollbar(canvas_frame, orientation="horizontal", command=self.scroll_x)
+        x_scrollbar.grid(row=1, column=0, sticky="ew")
+
+        self.canvas.configure(
+            xscrollcommand=x_scrollbar.set,
+            yscrollcommand=y_scrollbar.set
+        )
+
+        # Drag to pan, wheel to scroll, resize to refill the view
+        self.canvas.bind("<ButtonPress-1>", lambda e: self.canvas.scan_mark(e.x, e.y))
+        self.canvas.bind("<B1-Motion>", self.pan)
+        self.canvas.bind("<MouseWheel>", self.mouse_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_y("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_y("scroll", 1, "units"))
+        self.canvas.bind("<Configure>", self.on_resize)
+
     def load_psd(self):
         try:
-            psd = PSDImage.open(self.psd_path)
-            self.psd = psd
-            self.image = psd.topil()
+            if get_loader(self.psd_path) is PSD_LOADER:
+                psd = PSDImage.open(self.psd_path)
+                self.psd = psd
+                self.image = psd.topil()
+            else:
+                # Pre-rendered images and layer selections are loaded already flattened
+                self.psd = None
+                self.image = load_image(self.psd_path)
+
+            if self.image is None:
+                raise ValueError("No image data")
+
+            # Built once, every zoom level is served from it
+            self.pyramid = ImagePyramid(self.image)
             self.update_preview()
             self.update_info()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load PSD: {str(e)}")
             self.destroy()
 
+    def update_info(self):
+        info_text = f"{self.image.width}x{self.image.height}px, {self.image.mode}"
+        if self.psd is not None:
+            info_text += f", {len(self.psd.layers)} layers"
+        self.info_label.configure(text=info_text)
+
+    def get_zoom(self):
+        """Return the selected zoom factor, "Fit" scales the image to the canvas"""
+        value = self.zoom_var.get()
+        if value == "Fit":
+            canvas_width = max(self.canvas.winfo_width(), 1)
+            canvas_height = max(self.canvas.winfo_height(), 1)
+            return min(canvas_width / self.image.width, canvas_height / self.image.height, 1.0)
+        return int(value.rstrip('%')) / 100
+
     def update_preview(self, *args):
         try:
-            if self.image is None:
+            if self.pyramid is None:
                 raise ValueError("No image loaded")
 
-            # Apply zoom
-            zoom = int(self.zoom_var.get().rstrip('%')) / 100
-            if zoom != 1:
-                new_size = (int(self.image.width * zoom), int(self.image.height * zoom))
-                display_image = self.image.resize(new_size, Image.Resampling.LANCZOS)
-            else:
-                display_image = self.image
+            self.zoom = self.get_zoom()
 
-            # Convert to RGB if necessary
-            if display_image.mode != 'RGB':
-                display_image = display_image.convert('RGB')
-
-            # Update canvas
-            self.photo = ImageTk.PhotoImage(display_image)
+            # Drop all tiles from the previous zoom level
             self.canvas.delete("all")
-            self.canvas.create_image(0, 0, image=self.photo, anchor="nw")
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+            self.drawn_tiles = {}
+
+            width, height = self.pyramid.zoomed_size(self.zoom)
+            self.canvas.configure(scrollregion=(0, 0, width, height))
+            self.render_visible_tiles()
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to update preview: {str(e)}")
 
+    def schedule_render(self):
+        """Coalesce scroll and resize events into one tile update"""
+        if not self.render_pending:
+            self.render_pending = True
+            self.after_idle(self.render_visible_tiles)
+
+    def render_visible_tiles(self):
+        """Draw the tiles inside the visible area and forget the rest"""
+        self.render_pending = False
+        if self.pyramid is None:
+            return
+
+        tile_size = self.pyramid.tile_size
+        columns, rows = self.pyramid.tile_grid(self.zoom)
+
+        left = self.canvas.canvasx(0)
+        top = self.canvas.canvasy(0)
+        right = left + self.canvas.winfo_width()
+        bottom = top + self.canvas.winfo_height()
+
+        first_column = max(0, int(left // tile_size))
+        last_column = min(columns - 1, int(right // tile_size))
+        first_row = max(0, int(top // tile_size))
+        last_row = min(rows - 1, int(bottom // tile_size))
+
+        visible = {
+            (column, row)
+            for column in range(first_column, last_column + 1)
+            for row in range(first_row, last_row + 1)
+        }
+
+        # Free Tk images for tiles that scrolled out of view
+        for key in list(self.drawn_tiles):
+            if key not in visible:
+                item, _ = self.drawn_tiles.pop(key)
+                self.canvas.delete(item)
+
+        for column, row in visible:
+            if (column, row) in self.drawn_tiles:
+                continue
+            tile = self.pyramid.get_tile(self.zoom, column, row)
+            photo = ImageTk.PhotoImage(tile)
+            item = self.canvas.create_image(
+                column * tile_size, row * tile_size,
+                image=photo, anchor="nw"
+            )
+            self.drawn_tiles[(column, row)] = (item, photo)
+
+    def scroll_x(self, *args):
+        self.canvas.xview(*args)
+        self.schedule_render()
+
+    def scroll_y(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_render()
+
+    def pan(self, event):
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.schedule_render()
+
+    def mouse_wheel(self, event):
+        self.scroll_y("scroll", -1 if event.delta > 0 else 1, "units")
+
+    def on_resize(self, event):
+        if self.zoom_var.get() == "Fit":
+            self.update_preview()
+        else:
+            self.schedule_render()
+
 class BatchPreviewWindow(ctk.CTkToplevel):
     def __init__(self, parent, psd_files):
         super().__init__(parent)
@@ -105,8 +267,20 @@ class BatchPreviewWindow(ctk.CTkToplevel):
                 thumb_frame.grid(row=row, column=col, padx=5, pady=5)
 
                 # Load and create thumbnail
-                psd = PSDImage.open(psd_path)
-                img = psd.compose()
+                loader = get_loader(psd_path)
+                if loader is PSD_LOADER:
+                    psd = PSDImage.open(psd_path)
+                    img = psd.compose()
+                    info_text = f"{psd.width}x{psd.height}px\n"
+                    info_text += f"{psd.color_mode.name}, {len(psd.layers)} layers"
+                else:
+                    img = load_image(psd_path, THUMBNAIL_SIZE)
+                    info = read_image_info(psd_path)
+                    info_text = f"{info['width']}x{info['height']}px\n"
+                    if getattr(psd_path, 'layers', None):
+                        info_text += f"{info['color_mode']}, {len(psd_path.layers)} layers selected"
+                    else:
+                        info_text += f"{info['color_mode']}, flat image"
 
                 # Convert to RGB if necessary
                 if img.mode in ['RGBA', 'LA'] or (img.mode == 'P' and 'transparency' in img.info):
@@ -124,14 +298,12 @@ class BatchPreviewWindow(ctk.CTkToplevel):
                 # Add filename
                 name_label = ctk.CTkLabel(
                     thumb_frame,
-                    text=os.path.basename(psd_path),
+                    text=str(psd_path) if getattr(psd_path, 'layers', None) else os.path.basename(psd_path),
                     wraplength=180
                 )
                 name_label.pack(padx=5, pady=(0, 5))
 
                 # Add info
-                info_text = f"{psd.width}x{psd.height}px\n"
-                info_text += f"{psd.color_mode.name}, {len(psd.layers)} layers"
                 info_label = ctk.CTkLabel(
                     thumb_frame,
                     text=info_text,
@@ -169,7 +341,8 @@ class BatchPreviewWindow(ctk.CTkToplevel):
 
         # Sort files based on selected criterion
         if self.sort_var.get() == "name":
-            sorted_files = sorted(self.psd_files)
+            # Deck specs mix plain paths and DeckCards, layer variants of one master stay together
+            sorted_files = sorted(self.psd_files, key=lambda source: (os.fspath(source).lower(), str(source)))
         elif self.sort_var.get() == "size":
             sorted_files = sorted(self.psd_files, key=os.path.getsize)
         else:  # date
@@ -178,3 +351,133 @@ class BatchPreviewWindow(ctk.CTkToplevel):
         # Reload previews with sorted files
         self.psd_files = sorted_files
         self.load_previews()
+
+class SheetPreviewWindow(ctk.CTkToplevel):
+    PREVIEW_SCALE = 3.0  # Pixels per millimeter
+
+    def __init__(self, parent, recto_files, verso_file, layout, reg_marks=True, color_bars=True):
+        super().__init__(parent)
+
+        self.title("Sheet Preview")
+        self.geometry("760x1000")
+        self.recto_files = list(recto_files)
+        self.verso_file = verso_file
+        self.layout = layout
+        self.reg_marks = reg_marks
+        self.color_bars = color_bars
+
+        self.sheet_index = 0
+        self.total_sheets = max(1, math.ceil(len(self.recto_files) / layout.cards_per_sheet))
+        self.render_generation = 0
+        self.thumbnail_size = (
+            round(layout.cell_width * self.PREVIEW_SCALE),
+            round(layout.cell_height * self.PREVIEW_SCALE)
+        )
+
+        # The visible sheet gets its own pool so warming the rest of the deck never delays it
+        self.foreground_pool = ThreadPoolExecutor(max_workers=4)
+        self.background_pool = ThreadPoolExecutor(max_workers=2)
+
+        self.transient(parent)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.setup_ui()
+        self.warm_thumbnails()
+        self.show_sheet()
+
+    def setup_ui(self):
+        # Navigation frame
+        nav_frame = ctk.CTkFrame(self)
+        nav_frame.pack(fill="x", padx=10, pady=(10, 5))
+
+        prev_button = ctk.CTkButton(nav_frame, text="< Previous", width=100,
+                                    command=lambda: self.change_sheet(-1))
+        prev_button.pack(side="left", padx=5)
+
+        next_button = ctk.CTkButton(nav_frame, text="Next >", width=100,
+                                    command=lambda: self.change_sheet(1))
+        next_button.pack(side="left", padx=5)
+
+        self.side_var = ctk.StringVar(value="Recto")
+        side_button = ctk.CTkSegmentedButton(
+            nav_frame,
+            values=["Recto", "Verso"],
+            variable=self.side_var,
+            command=lambda value: self.show_sheet()
+        )
+        side_button.pack(side="left", padx=10)
+
+        self.sheet_label = ctk.CTkLabel(nav_frame, text="")
+        self.sheet_label.pack(side="left", padx=10)
+
+        # Sheet image
+        self.image_label = ttk.Label(self)
+        self.image_label.pack(padx=10, pady=(5, 10))
+
+        self.bind("<Left>", lambda e: self.change_sheet(-1))
+        self.bind("<Right>", lambda e: self.change_sheet(1))
+
+    def warm_thumbnails(self):
+        """Decode thumbnails for the whole deck in the background"""
+        for source in dict.fromkeys(self.recto_files + [self.verso_file]):
+            self.background_pool.submit(self.get_thumbnail, source)
+
+    def get_thumbnail(self, source):
+        try:
+            return THUMBNAIL_CACHE.get(source, self.thumbnail_size)
+        except Exception as e:
+            print(f"Warning: Could not preview {os.path.basename(source)}: {str(e)}")
+            return Image.new('RGB', self.thumbnail_size, (200, 60, 60))
+
+    def sheet_cards(self):
+        """Return the card files of the current sheet and side"""
+        start = self.sheet_index * self.layout.cards_per_sheet
+        cards = self.recto_files[start:start + self.layout.cards_per_sheet]
+        if self.side_var.get() == "Verso":
+            return [self.verso_file] * len(cards)
+        return cards
+
+    def change_sheet(self, step):
+        self.sheet_index = min(max(self.sheet_index + step, 0), self.total_sheets - 1)
+        self.show_sheet()
+
+    def show_sheet(self):
+        is_verso = self.side_var.get() == "Verso"
+        self.sheet_label.configure(
+            text=f"Sheet {self.sheet_index + 1} of {self.total_sheets} - {self.side_var.get()}"
+        )
+
+        # Newer requests supersede ones still waiting on thumbnails
+        self.render_generation += 1
+        generation = self.render_generation
+
+        cards = self.sheet_cards()
+        futures = {
+            source: self.foreground_pool.submit(self.get_thumbnail, source)
+            for source in dict.fromkeys(cards)
+        }
+        self.wait_for_sheet(generation, cards, futures, is_verso)
+
+    def wait_for_sheet(self, generation, cards, futures, is_verso):
+        if generation != self.render_generation:
+            return
+        if not all(future.done() for future in futures.values()):
+            self.after(30, self.wait_for_sheet, generation, cards, futures, is_verso)
+            return
+
+        images = [futures[source].result() for source in cards]
+        page = render_sheet_image(
+            self.layout, images, self.PREVIEW_SCALE,
+            is_verso=is_verso,
+            reg_marks=self.reg_marks,
+            color_bars=self.color_bars
+        )
+
+        self.photo = ImageTk.PhotoImage(page)
+        self.image_label.configure(image=self.photo)
+
+    def close(self):
+        self.render_generation += 1
+        self.foreground_pool.shutdown(wait=False, cancel_futures=True)
+        self.background_pool.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
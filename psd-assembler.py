@@ -7,7 +7,7 @@ import os
 import math
 import tempfile
 import shutil
-from threading import Thread
+from threading import Thread, Event
 from datetime import datetime
 from pathlib import Path
 from reportlab.pdfgen import canvas
@@ -16,11 +16,32 @@ from reportlab.lib.units import mm
 from PyPDF2 import PdfMerger
 
 # Import from other parts
-from preview_windows import PreviewWindow, BatchPreviewWindow
-from pdf_creator import PDFCreator, PDFHelper
+from preview_windows import PreviewWindow, BatchPreviewWindow, SheetPreviewWindow
+from pdf_creator import PDFCreator, PDFHelper, JobCancelled, OutputTarget
+from job_journal import JobJournal
+from scratch_space import RAM_DISK
+from preflight import PreflightChecker
+from deck_spec import DeckCard, load_deck_spec
+from sheet_layout import SheetLayout
+from tiff_export import COMPRESSION_NONE, COMPRESSION_DEFLATE, COMPRESSION_LZW
 from psd_tools import PSDImage
 
 class PSDAssembler(ctk.CTk):
+    INPUT_FILETYPES = [
+        ("Card images", "*.psd *.psb *.png *.tif *.tiff *.jpg *.jpeg"),
+        ("PSD files", "*.psd *.psb"),
+        ("Flat images", "*.png *.tif *.tiff *.jpg *.jpeg"),
+        ("All files", "*.*")
+    ]
+
+    # Output format and its TIFF compression (None writes a PDF)
+    OUTPUT_FORMATS = {
+        "PDF": None,
+        "TIFF": COMPRESSION_NONE,
+        "TIFF (Deflate)": COMPRESSION_DEFLATE,
+        "TIFF (LZW)": COMPRESSION_LZW
+    }
+
     def __init__(self):
         super().__init__()
 
@@ -37,6 +58,9 @@ class PSDAssembler(ctk.CTk):
         self.verso_file = None
         self.output_directory = None
         self.processing_error = None
+        self.processing_cancelled = False
+        self.failed_cards = []
+        self.cancel_event = Event()
 
         # Set up GUI
         self.setup_window()
@@ -121,6 +145,20 @@ class PSDAssembler(ctk.CTk):
         self.verso_label = ctk.CTkLabel(verso_frame, text="No file selected")
         self.verso_label.pack(side="left", padx=5)
 
+        # Deck spec selection
+        spec_frame = ctk.CTkFrame(file_frame)
+        spec_frame.pack(fill="x", pady=5)
+
+        spec_button = ctk.CTkButton(
+            spec_frame,
+            text="Load Deck Spec",
+            command=self.select_deck_spec
+        )
+        spec_button.pack(side="left", padx=5)
+
+        self.spec_label = ctk.CTkLabel(spec_frame, text="Optional: JSON list of cards and layer variants")
+        self.spec_label.pack(side="left", padx=5)
+
         # Output directory selection
         output_frame = ctk.CTkFrame(file_frame)
         output_frame.pack(fill="x", pady=5)
@@ -163,6 +201,70 @@ class PSDAssembler(ctk.CTk):
         )
         dpi_menu.pack(side="left", padx=5)
 
+        # Output format
+        format_frame = ctk.CTkFrame(settings_frame)
+        format_frame.pack(fill="x", pady=5)
+
+        format_label = ctk.CTkLabel(format_frame, text="Output Format:")
+        format_label.pack(side="left", padx=5)
+
+        self.format_var = ctk.StringVar(value="PDF")
+        format_menu = ctk.CTkOptionMenu(
+            format_frame,
+            values=list(self.OUTPUT_FORMATS),
+            variable=self.format_var
+        )
+        format_menu.pack(side="left", padx=5)
+
+        # Decode workers
+        workers_frame = ctk.CTkFrame(settings_frame)
+        workers_frame.pack(fill="x", pady=5)
+
+        workers_label = ctk.CTkLabel(workers_frame, text="Decode Workers:")
+        workers_label.pack(side="left", padx=5)
+
+        self.workers_var = ctk.StringVar(value=str(min(4, os.cpu_count() or 1)))
+        workers_menu = ctk.CTkOptionMenu(
+            workers_frame,
+            values=["1", "2", "4", "8"],
+            variable=self.workers_var
+        )
+        workers_menu.pack(side="left", padx=5)
+
+        memory_label = ctk.CTkLabel(workers_frame, text="Memory Budget (MB):")
+        memory_label.pack(side="left", padx=5)
+
+        self.memory_budget_var = ctk.StringVar(value="Auto")
+        memory_menu = ctk.CTkOptionMenu(
+            workers_frame,
+            values=["Auto", "1024", "2048", "4096", "8192"],
+            variable=self.memory_budget_var
+        )
+        memory_menu.pack(side="left", padx=5)
+
+        # Output splitting
+        shard_frame = ctk.CTkFrame(settings_frame)
+        shard_frame.pack(fill="x", pady=5)
+
+        shard_label = ctk.CTkLabel(shard_frame, text="Sheets per PDF:")
+        shard_label.pack(side="left", padx=5)
+
+        self.shard_var = ctk.StringVar(value="All")
+        shard_menu = ctk.CTkOptionMenu(
+            shard_frame,
+            values=["All", "10", "25", "50"],
+            variable=self.shard_var
+        )
+        shard_menu.pack(side="left", padx=5)
+
+        self.join_shards_var = ctk.BooleanVar(value=False)
+        join_shards_cb = ctk.CTkCheckBox(
+            shard_frame,
+            text="Also Write Single PDF",
+            variable=self.join_shards_var
+        )
+        join_shards_cb.pack(side="left", padx=5)
+
         # Print options
         self.reg_marks_var = ctk.BooleanVar(value=True)
         reg_marks_cb = ctk.CTkCheckBox(
@@ -188,16 +290,94 @@ class PSDAssembler(ctk.CTk):
         )
         optimize_cb.pack(pady=5)
 
+        self.ram_disk_var = ctk.BooleanVar(value=False)
+        ram_disk_cb = ctk.CTkCheckBox(
+            settings_frame,
+            text="Use RAM Disk for Scratch Files",
+            variable=self.ram_disk_var
+        )
+        ram_disk_cb.pack(pady=5)
+
+        self.review_pdf_var = ctk.BooleanVar(value=False)
+        review_pdf_cb = ctk.CTkCheckBox(
+            settings_frame,
+            text="Also Write 150 DPI Review PDF",
+            variable=self.review_pdf_var
+        )
+        review_pdf_cb.pack(pady=5)
+
+        self.draft_proof_var = ctk.BooleanVar(value=False)
+        draft_proof_cb = ctk.CTkCheckBox(
+            settings_frame,
+            text="Write Draft Proof First",
+            variable=self.draft_proof_var
+        )
+        draft_proof_cb.pack(pady=5)
+
+        self.read_ahead_var = ctk.BooleanVar(value=True)
+        read_ahead_cb = ctk.CTkCheckBox(
+            settings_frame,
+            text="Read Ahead from Slow Storage",
+            variable=self.read_ahead_var
+        )
+        read_ahead_cb.pack(pady=5)
+
+        self.isolate_var = ctk.BooleanVar(value=True)
+        isolate_cb = ctk.CTkCheckBox(
+            settings_frame,
+            text="Isolate Card Decoding (Placeholder for Bad Files)",
+            variable=self.isolate_var
+        )
+        isolate_cb.pack(pady=5)
+
+        self.resume_var = ctk.BooleanVar(value=True)
+        resume_cb = ctk.CTkCheckBox(
+            settings_frame,
+            text="Resume Interrupted Job",
+            variable=self.resume_var
+        )
+        resume_cb.pack(pady=5)
+
     def setup_processing_controls(self):
         """Set up the processing controls section"""
+        buttons_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        buttons_frame.pack(pady=20)
+
+        # Sheet preview button
+        self.sheet_preview_button = ctk.CTkButton(
+            buttons_frame,
+            text="Preview Sheets",
+            command=self.preview_sheets,
+            state="disabled"
+        )
+        self.sheet_preview_button.pack(side="left", padx=5)
+
+        # Pre-flight button
+        self.preflight_button = ctk.CTkButton(
+            buttons_frame,
+            text="Pre-flight Check",
+            command=self.run_preflight,
+            state="disabled"
+        )
+        self.preflight_button.pack(side="left", padx=5)
+
         # Process button
         self.process_button = ctk.CTkButton(
-            self.main_frame,
+            buttons_frame,
             text="Process Files",
             command=self.start_processing,
             state="disabled"
         )
-        self.process_button.pack(pady=20)
+        self.process_button.pack(side="left", padx=5)
+
+        # Cancel button
+        self.cancel_button = ctk.CTkButton(
+            buttons_frame,
+            text="Cancel",
+            command=self.cancel_processing,
+            state="disabled"
+        )
+        self.cancel_button.pack(side="left", padx=5)
 
         # Progress bar
         self.progress_bar = ctk.CTkProgressBar(self.main_frame)
@@ -212,11 +392,20 @@ class PSDAssembler(ctk.CTk):
         )
         self.status_label.pack(pady=5)
 
+        # Draft proof notice, kept visible while the press pass reports its progress
+        self.draft_label = ctk.CTkLabel(
+            self.main_frame,
+            text="",
+            text_color="light green"
+        )
+        self.draft_label.pack(pady=5)
+        self.draft_label.pack_forget()
+
     def select_recto_files(self):
         """Handle recto file selection"""
         files = filedialog.askopenfilenames(
-            title="Select Recto PSD Files",
-            filetypes=[("PSD files", "*.psd"), ("All files", "*.*")]
+            title="Select Recto Files",
+            filetypes=self.INPUT_FILETYPES
         )
 
         if files:
@@ -233,7 +422,7 @@ class PSDAssembler(ctk.CTk):
         """Handle verso file selection"""
         file = filedialog.askopenfilename(
             title="Select Verso File",
-            filetypes=[("PSD files", "*.psd"), ("All files", "*.*")]
+            filetypes=self.INPUT_FILETYPES
         )
 
         if file:
@@ -246,6 +435,35 @@ class PSDAssembler(ctk.CTk):
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
+    def select_deck_spec(self):
+        """Load recto cards (and optionally the verso) from a deck spec file"""
+        file = filedialog.askopenfilename(
+            title="Select Deck Spec",
+            filetypes=[("Deck spec", "*.json"), ("All files", "*.*")]
+        )
+
+        if file:
+            try:
+                cards, verso = load_deck_spec(file)
+                if not cards:
+                    raise ValueError("The deck spec does not list any cards")
+
+                self.recto_files = cards
+                self.recto_label.configure(text=f"Selected {len(cards)} recto files")
+                self.recto_preview_button.configure(state="normal")
+
+                if verso:
+                    self.verso_file = verso
+                    name = str(verso) if isinstance(verso, DeckCard) else Path(verso).name
+                    self.verso_label.configure(text=f"Selected: {name}")
+                    self.verso_preview_button.configure(state="normal")
+
+                self.spec_label.configure(text=f"Spec: {Path(file).name}")
+                self.update_process_button()
+
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+
     def select_output_directory(self):
         """Handle output directory selection"""
         directory = filedialog.askdirectory(title="Select Output Directory")
@@ -268,8 +486,25 @@ class PSDAssembler(ctk.CTk):
         if self.verso_file:
             PreviewWindow(self, self.verso_file, "Verso Preview")
 
+    def preview_sheets(self):
+        """Show the imposed sheets at screen resolution without building the PDF"""
+        if self.recto_files and self.verso_file:
+            layout = SheetLayout(
+                self.A4_WIDTH, self.A4_HEIGHT,
+                self.CARD_WIDTH, self.CARD_HEIGHT, self.BLEED
+            )
+            SheetPreviewWindow(
+                self, self.recto_files, self.verso_file, layout,
+                reg_marks=self.reg_marks_var.get(),
+                color_bars=self.color_bars_var.get()
+            )
+
     def update_process_button(self):
         """Update process button state and show warnings if needed"""
+        self.sheet_preview_button.configure(
+            state="normal" if self.recto_files and self.verso_file else "disabled"
+        )
+
         if self.recto_files and self.verso_file and self.output_directory:
             # Calculate needed sheets
             total_sheets = math.ceil(len(self.recto_files) / self.CARDS_PER_SHEET)
@@ -290,27 +525,90 @@ class PSDAssembler(ctk.CTk):
                 )
 
             self.process_button.configure(state="normal")
+            self.preflight_button.configure(state="normal")
         else:
             self.process_button.configure(state="disabled")
+            self.preflight_button.configure(state="disabled")
             self.status_label.configure(
                 text="Please select all required files and output directory",
                 text_color="white"
             )
 
+    def create_preflight_checker(self):
+        """Create a pre-flight checker for the current settings"""
+        return PreflightChecker(
+            card_width=self.CARD_WIDTH,
+            card_height=self.CARD_HEIGHT,
+            bleed=self.BLEED,
+            dpi=int(self.dpi_var.get()),
+            # Isolated decoding replaces unreadable cards with placeholders instead
+            unreadable_is_warning=self.isolate_var.get()
+        )
+
+    def run_preflight(self):
+        """Check all selected files without decoding them and show the report"""
+        self.status_label.configure(text="Running pre-flight check...", text_color="white")
+        self.update_idletasks()
+
+        report = self.create_preflight_checker().run(
+            list(self.recto_files) + [self.verso_file]
+        )
+        print(report.format())
+
+        if report.ok:
+            self.status_label.configure(text=report.summary(), text_color="white")
+            if report.warnings:
+                messagebox.showwarning("Pre-flight", report.format())
+            else:
+                messagebox.showinfo("Pre-flight", report.summary())
+        else:
+            self.status_label.configure(text=report.summary(), text_color="red")
+            messagebox.showerror("Pre-flight", report.format())
+
+    def output_option_conflicts(self):
+        """Return the selected output options that cannot be combined, or None"""
+        tiff = self.OUTPUT_FORMATS[self.format_var.get()] is not None
+        review = self.review_pdf_var.get()
+        draft = self.draft_proof_var.get()
+        split = self.shard_var.get() != "All"
+
+        if tiff and (review or draft or split):
+            options = [name for name, selected in (
+                ("a review PDF", review), ("a draft proof", draft), ("split PDF output", split)
+            ) if selected]
+            return (f"TIFF export writes one file per sheet side and cannot be combined with "
+                    f"{' or '.join(options)}.")
+        if review and draft:
+            return "The review PDF and the draft proof cannot be written in the same run."
+        return None
+
     def start_processing(self):
         """Start the processing operation"""
+        # Options that would silently override each other are rejected up front
+        conflict = self.output_option_conflicts()
+        if conflict:
+            messagebox.showerror("Output Options", conflict)
+            return
+
         # Show progress bar
         self.progress_bar.pack(pady=10, fill="x", padx=20)
         self.progress_bar.set(0)
 
+        # Hide the draft notice of a previous run
+        self.draft_label.pack_forget()
+
         # Disable controls during processing
         self.process_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
 
         # Reset error state
         self.processing_error = None
+        self.processing_cancelled = False
+        self.failed_cards = []
+        self.cancel_event.clear()
 
-        # Start processing thread
-        self.processing_thread = Thread(target=self.process_files)
+        # Start processing thread, it must not keep the app alive on exit
+        self.processing_thread = Thread(target=self.process_files, daemon=True)
         self.processing_thread.start()
 
         # Start monitoring
@@ -325,7 +623,12 @@ class PSDAssembler(ctk.CTk):
             self.progress_bar.pack_forget()
 
             # Check for errors
-            if self.processing_error:
+            if self.processing_cancelled:
+                message = "Processing cancelled."
+                if self.resume_var.get():
+                    message += " Completed sheets are kept for resuming."
+                self.status_label.configure(text=message, text_color="orange")
+            elif self.processing_error:
                 # Show error in main thread
                 self.after(0, lambda: messagebox.showerror(
                     "Error",
@@ -335,6 +638,18 @@ class PSDAssembler(ctk.CTk):
                     text=f"Error: {str(self.processing_error)}",
                     text_color="red"
                 )
+            elif self.failed_cards:
+                # The deck is complete apart from the cards that could not be decoded
+                failed = "\n".join(f"{source}: {reason}" for source, reason in self.failed_cards)
+                self.after(0, lambda: messagebox.showwarning(
+                    "Complete with Placeholders",
+                    f"{len(self.failed_cards)} cards could not be decoded and were replaced "
+                    f"by placeholders:\n\n{failed}"
+                ))
+                self.status_label.configure(
+                    text=f"Completed with {len(self.failed_cards)} placeholder cards",
+                    text_color="orange"
+                )
             else:
                 # Show completion message
                 self.after(0, lambda: messagebox.showinfo(
@@ -348,6 +663,13 @@ class PSDAssembler(ctk.CTk):
 
             # Re-enable controls
             self.process_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
+
+    def cancel_processing(self):
+        """Ask the processing thread to stop after the current card"""
+        self.cancel_event.set()
+        self.cancel_button.configure(state="disabled")
+        self.status_label.configure(text="Cancelling...", text_color="orange")
 
     def update_status(self, message, color="white"):
         """Thread-safe status update"""
@@ -356,6 +678,13 @@ class PSDAssembler(ctk.CTk):
             text_color=color
         ))
 
+    def show_draft_notice(self, message):
+        """Thread-safe draft notice update"""
+        self.after(0, lambda: (
+            self.draft_label.configure(text=message),
+            self.draft_label.pack(pady=5, after=self.status_label)
+        ))
+
     def update_progress(self, value):
         """Thread-safe progress update"""
         self.after(0, lambda: self.progress_bar.set(value))
@@ -363,28 +692,145 @@ class PSDAssembler(ctk.CTk):
     def process_files(self):
         """Process the PSD files and create PDF output"""
         try:
-            pdf_creator = PDFCreator()
-            pdf_creator.set_optimization(self.optimize_var.get())
+            # Fail fast on wrongly sized (and, without isolation, unreadable) files before the long run
+            self.update_status("Running pre-flight check...")
+            report = self.create_preflight_checker().run(
+                list(self.recto_files) + [self.verso_file]
+            )
+            print(report.format())
+            if not report.ok:
+                raise ValueError(report.format())
 
             # Create output PDF
             output_pdf = os.path.join(self.output_directory, "cards.pdf")
 
-            # Process all files in batch
-            pdf_creator.process_batch(
-                recto_files=self.recto_files,
-                verso_file=self.verso_file,
-                output_path=output_pdf,
-                card_width=self.CARD_WIDTH,
-                card_height=self.CARD_HEIGHT,
-                bleed=self.BLEED,
-                dpi=int(self.dpi_var.get()),
-                reg_marks=self.reg_marks_var.get(),
-                color_bars=self.color_bars_var.get(),
-                progress_callback=lambda progress, message: (
-                    self.update_progress(progress),
-                    self.update_status(message)
+            tiff_compression = self.OUTPUT_FORMATS[self.format_var.get()]
+
+            # Resumable jobs checkpoint completed sheets next to the output, others keep them in scratch
+            journal = None
+            if self.resume_var.get():
+                journal = JobJournal(
+                    os.path.join(self.output_directory, ".cards_job"),
+                    {
+                        'output': output_pdf,
+                        'format': self.format_var.get(),
+                        'review': self.review_pdf_var.get(),
+                        'card_width': self.CARD_WIDTH,
+                        'card_height': self.CARD_HEIGHT,
+                        'bleed': self.BLEED,
+                        'dpi': int(self.dpi_var.get()),
+                        'reg_marks': self.reg_marks_var.get(),
+                        'color_bars': self.color_bars_var.get(),
+                        'optimize': self.optimize_var.get()
+                    }
                 )
-            )
+
+            # Scratch files and decode workers are released on success, error or cancel
+            scratch_dir = RAM_DISK if self.ram_disk_var.get() else None
+            try:
+                with PDFCreator(scratch_dir=scratch_dir) as pdf_creator:
+                    pdf_creator.set_optimization(self.optimize_var.get())
+                    pdf_creator.set_workers(int(self.workers_var.get()))
+                    if self.memory_budget_var.get() != "Auto":
+                        pdf_creator.set_memory_budget(int(self.memory_budget_var.get()))
+                    pdf_creator.set_cancel_event(self.cancel_event)
+                    pdf_creator.set_journal(journal)
+                    pdf_creator.set_prefetch(4 if self.read_ahead_var.get() else 0)
+                    # Isolated workers are each limited to a share of the memory budget
+                    pdf_creator.set_isolation(self.isolate_var.get())
+                    if self.shard_var.get() != "All":
+                        pdf_creator.set_sharding(int(self.shard_var.get()), self.join_shards_var.get())
+
+                    progress_callback = lambda progress, message: (
+                        self.update_progress(progress),
+                        self.update_status(message)
+                    )
+
+                    if tiff_compression is not None:
+                        # One TIFF per sheet side, streamed strip by strip
+                        pdf_creator.process_tiff(
+                            recto_files=self.recto_files,
+                            verso_file=self.verso_file,
+                            output_dir=os.path.join(self.output_directory, "cards_tiff"),
+                            card_width=self.CARD_WIDTH,
+                            card_height=self.CARD_HEIGHT,
+                            bleed=self.BLEED,
+                            dpi=int(self.dpi_var.get()),
+                            reg_marks=self.reg_marks_var.get(),
+                            color_bars=self.color_bars_var.get(),
+                            compression=tiff_compression,
+                            progress_callback=progress_callback
+                        )
+                    elif self.review_pdf_var.get():
+                        # Both PDFs are written from one decode pass
+                        pdf_creator.process_targets(
+                            recto_files=self.recto_files,
+                            verso_file=self.verso_file,
+                            targets=[
+                                OutputTarget(
+                                    output_pdf,
+                                    dpi=int(self.dpi_var.get()),
+                                    optimize=self.optimize_var.get(),
+                                    reg_marks=self.reg_marks_var.get(),
+                                    color_bars=self.color_bars_var.get()
+                                ),
+                                OutputTarget(
+                                    os.path.join(self.output_directory, "cards_review.pdf"),
+                                    dpi=150,
+                                    optimize=True,
+                                    reg_marks=self.reg_marks_var.get(),
+                                    color_bars=self.color_bars_var.get()
+                                )
+                            ],
+                            card_width=self.CARD_WIDTH,
+                            card_height=self.CARD_HEIGHT,
+                            bleed=self.BLEED,
+                            progress_callback=progress_callback
+                        )
+                    elif self.draft_proof_var.get():
+                        # A low resolution draft for checking the layout comes first
+                        pdf_creator.process_progressive(
+                            recto_files=self.recto_files,
+                            verso_file=self.verso_file,
+                            output_path=output_pdf,
+                            draft_path=os.path.join(self.output_directory, "cards_draft.pdf"),
+                            card_width=self.CARD_WIDTH,
+                            card_height=self.CARD_HEIGHT,
+                            bleed=self.BLEED,
+                            dpi=int(self.dpi_var.get()),
+                            reg_marks=self.reg_marks_var.get(),
+                            color_bars=self.color_bars_var.get(),
+                            draft_callback=lambda progress, message: (
+                                self.show_draft_notice("Draft ready: cards_draft.pdf")
+                                if progress >= 1.0 else (
+                                    self.update_progress(progress),
+                                    self.update_status(f"Draft: {message}")
+                                )
+                            ),
+                            progress_callback=progress_callback
+                        )
+                    else:
+                        # Process all files in batch
+                        pdf_creator.process_batch(
+                            recto_files=self.recto_files,
+                            verso_file=self.verso_file,
+                            output_path=output_pdf,
+                            card_width=self.CARD_WIDTH,
+                            card_height=self.CARD_HEIGHT,
+                            bleed=self.BLEED,
+                            dpi=int(self.dpi_var.get()),
+                            reg_marks=self.reg_marks_var.get(),
+                            color_bars=self.color_bars_var.get(),
+                            progress_callback=progress_callback
+                        )
+
+                    self.failed_cards = list(pdf_creator.failed_cards)
+            finally:
+                if journal is not None:
+                    journal.close()
+
+        except JobCancelled:
+            self.processing_cancelled = True
 
         except Exception as e:
             self.processing_error = str(e)
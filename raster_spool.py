@@ -0,0 +1,82 @@
+# raster_spool.py
+import queue
+from multiprocessing import shared_memory
+from PIL import Image
+
+# RGBX matches PIL's internal 4-byte pixel layout, so frombuffer() can share the slot memory
+SPOOL_MODE = 'RGBX'
+SPOOL_BYTES_PER_PIXEL = 4
+
+# Slots attached by this worker process, kept open so each slot is mapped only once
+_attached_slots = {}
+
+class RasterSpool:
+    """
+    Ring of fixed-size shared memory slots used to hand decoded card rasters
+    from decode worker processes to the PDF writer without pickling them
+    """
+
+    def __init__(self, slot_count, slot_size):
+        self.slot_size = slot_size
+        self.slots = []
+        self.free_slots = queue.Queue()
+
+        try:
+            for index in range(slot_count):
+                self.slots.append(shared_memory.SharedMemory(create=True, size=slot_size))
+                self.free_slots.put(index)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def acquire(self, block=True):
+        """Take a free slot, blocking until the writer hands one back"""
+        return self.free_slots.get(block=block)
+
+    def release(self, index):
+        """Return a slot to the ring once its image is no longer referenced"""
+        self.free_slots.put(index)
+
+    def slot_name(self, index):
+        return self.slots[index].name
+
+    def read_image(self, index, size):
+        """Return a PIL Image backed directly by the slot memory"""
+        width, height = size
+        length = width * height * SPOOL_BYTES_PER_PIXEL
+        return Image.frombuffer(
+            SPOOL_MODE, size, self.slots[index].buf[:length], 'raw', SPOOL_MODE, 0, 1
+        )
+
+    def close(self):
+        """Free all shared memory blocks"""
+        for slot in self.slots:
+            try:
+                slot.unlink()
+                slot.close()
+            except (BufferError, FileNotFoundError) as e:
+                print(f"Warning: Could not release raster spool slot: {str(e)}")
+        self.slots = []
+
+def write_image_to_slot(slot_name, slot_size, image):
+    """Copy an image into a spool slot from a worker process and return its size"""
+    if image.mode != SPOOL_MODE:
+        image = image.convert(SPOOL_MODE)
+
+    data = image.tobytes()
+    if len(data) > slot_size:
+        raise ValueError(f"Image of {len(data)} bytes does not fit a {slot_size} byte slot")
+
+    slot = _attached_slots.get(slot_name)
+    if slot is None:
+        slot = shared_memory.SharedMemory(name=slot_name)
+        _attached_slots[slot_name] = slot
+
+    slot.buf[:len(data)] = data
+    return image.size
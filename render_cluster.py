@@ -0,0 +1,437 @@
+# render_cluster.py
+import os
+import sys
+import hmac
+import json
+import math
+import queue
+import time
+import socket
+import struct
+import getpass
+import secrets
+import argparse
+import threading
+import subprocess
+
+from pdf_creator import PDFCreator
+from scratch_space import ScratchQuotaError
+from deck_spec import DeckCard
+
+# Every message is a 4 byte header length, a JSON header and an optional binary payload
+HEADER_LENGTH = struct.Struct('>I')
+MAX_HEADER_SIZE = 16 * 1024 * 1024
+# Read before the token is checked, so an unauthenticated peer cannot make the coordinator allocate
+MAX_HELLO_SIZE = 4096
+# Largest sheet side PDF a worker may return, well above an unoptimised 600 DPI page
+MAX_PAGE_SIZE = 512 * 1024 * 1024
+MAX_TASK_ATTEMPTS = 2
+MAX_LOCAL_RESTARTS = 3
+
+# The shared secret is passed in the environment, command lines are visible to other users
+TOKEN_ENV = "TCG_CLUSTER_TOKEN"
+
+def read_token():
+    """Return the shared secret from the environment, or read it from stdin"""
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    if sys.stdin.isatty():
+        return getpass.getpass("Worker token: ")
+    return sys.stdin.readline().strip()
+
+def send_message(sock, header, payload=b''):
+    """Send a JSON header followed by an optional binary payload"""
+    header = dict(header, payload_size=len(payload))
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER_LENGTH.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+def receive_exactly(sock, size):
+    """Read exactly size bytes, raising ConnectionError if the peer goes away"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Connection closed")
+        received += count
+    return bytes(buffer)
+
+def receive_message(sock, max_header_size=MAX_HEADER_SIZE, max_payload_size=0):
+    """
+    Receive one message and return (header, payload). Sizes are checked
+    before anything is allocated, oversized messages raise ConnectionError
+    """
+    (length,) = HEADER_LENGTH.unpack(receive_exactly(sock, HEADER_LENGTH.size))
+    if length > max_header_size:
+        raise ConnectionError("Message header too large")
+    header = json.loads(receive_exactly(sock, length).decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ValueError("Message header is not an object")
+
+    payload_size = header.get('payload_size', 0)
+    if not isinstance(payload_size, int) or not 0 <= payload_size <= max_payload_size:
+        raise ConnectionError(f"Message payload of {payload_size} bytes not accepted")
+    payload = receive_exactly(sock, payload_size)
+    return header, payload
+
+def encode_source(source):
+    """Turn a card path or DeckCard into JSON"""
+    if isinstance(source, DeckCard):
+        return {'source': os.path.abspath(source.source), 'layers': list(source.layers)}
+    return {'source': os.path.abspath(source)}
+
+def decode_source(data):
+    """Turn JSON back into a card path or DeckCard"""
+    if data.get('layers'):
+        return DeckCard(data['source'], data['layers'])
+    return data['source']
+
+class RenderCoordinator:
+    """
+    Hands sheet sides to connected workers and assembles the returned
+    single-page PDFs into the final document in sheet order.
+    Workers must see the card files under the same paths (shared storage).
+    """
+
+    CARDS_PER_SHEET = 9  # Fixed 3x3 grid
+
+    def __init__(self, recto_files, verso_file, output_path, settings=None,
+                 host="127.0.0.1", port=0, token=None, task_timeout=600, worker_wait=300):
+        """
+        Args:
+            task_timeout: Seconds a worker may take for one sheet side before its
+                connection is dropped and the sheet side handed to another worker
+            worker_wait: Seconds the job waits with pages left but no worker connected
+        """
+        self.recto_files = list(recto_files)
+        self.verso_file = verso_file
+        self.output_path = output_path
+        self.settings = settings or {}
+        self.token = token or secrets.token_hex(16)
+        self.task_timeout = task_timeout
+        self.worker_wait = worker_wait
+
+        self.pdf_creator = PDFCreator()
+        self.tasks = queue.Queue()
+        self.results = {}
+        self.attempts = {}
+        self.failure = None
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.connected = set()
+        self.local_workers = {}
+        self.local_restarts = 0
+
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.5)
+        self.address = self.server.getsockname()
+
+        total_sheets = math.ceil(len(self.recto_files) / self.CARDS_PER_SHEET)
+        for sheet_num in range(total_sheets):
+            start_idx = sheet_num * self.CARDS_PER_SHEET
+            sheet_files = self.recto_files[start_idx:start_idx + self.CARDS_PER_SHEET]
+            self.tasks.put((sheet_num, "recto", sheet_files))
+            self.tasks.put((sheet_num, "verso", [self.verso_file] * len(sheet_files)))
+        self.total_tasks = total_sheets * 2
+
+    def run(self, progress_callback=None):
+        """Serve workers until every sheet side is rendered, then merge the PDF"""
+        print(f"Coordinator listening on {self.address[0]}:{self.address[1]}, "
+              f"{self.total_tasks} pages to render")
+        self.progress_callback = progress_callback
+        self.last_worker_seen = time.monotonic()
+
+        try:
+            while not self.finished.is_set():
+                self.check_workers()
+                try:
+                    connection, address = self.server.accept()
+                except socket.timeout:
+                    continue
+                threading.Thread(
+                    target=self.serve_worker, args=(connection, address), daemon=True
+                ).start()
+
+            if self.failure:
+                raise self.failure
+
+            if progress_callback:
+                progress_callback(0.9, "Merging PDFs...")
+
+            # Results arrive in completion order, put recto before verso for each sheet
+            generated_pdfs = [
+                path for (sheet_num, side), path in sorted(
+                    self.results.items(), key=lambda item: (item[0][0], item[0][1] == "verso"))
+            ]
+            self.pdf_creator.merge_pdfs(generated_pdfs, self.output_path)
+
+            if progress_callback:
+                progress_callback(1.0, f"Complete! Created {self.total_tasks} pages")
+
+        finally:
+            self.finished.set()
+            self.server.close()
+            self.stop_local_workers()
+            self.pdf_creator.cleanup()
+
+    def start_local_workers(self, count, connect_host="127.0.0.1"):
+        """Start worker processes on this machine standing in for remote nodes, restarted if they exit"""
+        self.connect_host = connect_host
+        for i in range(count):
+            name = f"local-{i + 1}"
+            self.local_workers[name] = self.spawn_local_worker(name)
+
+    def spawn_local_worker(self, name):
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "worker",
+             "--host", self.connect_host, "--port", str(self.address[1]), "--name", name],
+            env=dict(os.environ, **{TOKEN_ENV: self.token}),
+            stdin=subprocess.DEVNULL
+        )
+
+    def check_workers(self):
+        """Restart local workers that exited, and fail the job when no worker is left"""
+        for name, process in list(self.local_workers.items()):
+            if process.poll() is None:
+                continue
+            if self.local_restarts < MAX_LOCAL_RESTARTS * len(self.local_workers):
+                self.local_restarts += 1
+                print(f"Worker {name} exited with code {process.returncode}, restarting")
+                self.local_workers[name] = self.spawn_local_worker(name)
+            else:
+                print(f"Worker {name} exited with code {process.returncode}, too many restarts")
+                del self.local_workers[name]
+
+        with self.lock:
+            alive = bool(self.connected or self.local_workers)
+        if alive:
+            self.last_worker_seen = time.monotonic()
+        elif time.monotonic() - self.last_worker_seen > self.worker_wait:
+            raise ConnectionError(
+                f"No worker connected for {self.worker_wait} seconds with "
+                f"{self.total_tasks - len(self.results)} pages left"
+            )
+
+    def stop_local_workers(self):
+        """Wait briefly for local workers to finish and kill any that remain"""
+        for process in self.local_workers.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.local_workers = {}
+
+    def serve_worker(self, connection, address):
+        """Feed tasks to one worker connection until the job is done"""
+        task = None
+        name = f"{address[0]}:{address[1]}"
+
+        try:
+            with connection:
+                # A worker that hangs mid-task is dropped and its sheet side handed on
+                connection.settimeout(self.task_timeout)
+                header, _ = receive_message(connection, MAX_HELLO_SIZE)
+                if header.get('type') != 'hello' or not hmac.compare_digest(
+                        str(header.get('token', '')), self.token):
+                    print(f"Rejected worker {name}: bad token")
+                    return
+                name = header.get('name', name)
+                print(f"Worker {name} connected")
+                with self.lock:
+                    self.connected.add(name)
+
+                while not self.finished.is_set():
+                    try:
+                        task = self.tasks.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+
+                    sheet_num, side, sheet_files = task
+                    send_message(connection, {
+                        'type': 'task',
+                        'sheet': sheet_num,
+                        'side': side,
+                        'files': [encode_source(source) for source in sheet_files],
+                        'settings': self.settings
+                    })
+
+                    header, payload = receive_message(connection, max_payload_size=MAX_PAGE_SIZE)
+                    if header.get('type') == 'result':
+                        self.complete_task(sheet_num, side, payload)
+                    else:
+                        self.fail_task(task, header.get('message', 'Unknown error'), name)
+                    task = None
+
+                send_message(connection, {'type': 'done'})
+
+        except (OSError, ValueError) as e:
+            print(f"Worker {name} disconnected: {str(e) or type(e).__name__}")
+            if task is not None:
+                # Another worker picks the sheet up
+                self.tasks.put(task)
+            if isinstance(e, socket.timeout) and name in self.local_workers:
+                # Restarted by check_workers
+                self.local_workers[name].kill()
+
+        finally:
+            with self.lock:
+                self.connected.discard(name)
+
+    def complete_task(self, sheet_num, side, payload):
+        # Pages go to scratch as they arrive, only their paths are kept until the merge
+        path = os.path.join(self.pdf_creator.temp_dir, f"sheet_{sheet_num:03d}_{side}.pdf")
+        start = time.perf_counter()
+        with open(path, 'wb') as f:
+            f.write(payload)
+        self.pdf_creator.scratch.record_write(len(payload), time.perf_counter() - start)
+        try:
+            self.pdf_creator.scratch.add_file(path)
+        except ScratchQuotaError as e:
+            # Pages are kept until the merge, more workers would only add to them
+            self.failure = e
+            self.finished.set()
+            return
+
+        with self.lock:
+            self.results[(sheet_num, side)] = path
+            done = len(self.results)
+
+        print(f"Rendered sheet {sheet_num + 1} {side} ({done}/{self.total_tasks})")
+        if self.progress_callback:
+            self.progress_callback(done / self.total_tasks * 0.9, f"Rendered {done} of {self.total_tasks} pages")
+        if done == self.total_tasks:
+            self.finished.set()
+
+    def fail_task(self, task, message, name):
+        sheet_num, side, _ = task
+        with self.lock:
+            attempts = self.attempts.get((sheet_num, side), 0) + 1
+            self.attempts[(sheet_num, side)] = attempts
+
+        print(f"Worker {name} failed sheet {sheet_num + 1} {side}: {message}")
+        if attempts < MAX_TASK_ATTEMPTS:
+            self.tasks.put(task)
+        else:
+            self.failure = ValueError(f"Sheet {sheet_num + 1} {side} failed: {message}")
+            self.finished.set()
+
+class RenderWorker:
+    """Connects to a coordinator and renders the sheet sides it is sent"""
+
+    def __init__(self, host, port, token, name=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+
+    def run(self):
+        with PDFCreator() as pdf_creator, socket.create_connection((self.host, self.port)) as sock:
+            send_message(sock, {'type': 'hello', 'token': self.token, 'name': self.name})
+
+            while True:
+                try:
+                    header, _ = receive_message(sock)
+                except ConnectionError:
+                    break
+
+                if header.get('type') != 'task':
+                    break
+
+                try:
+                    payload = self.render(pdf_creator, header)
+                    send_message(sock, {'type': 'result'}, payload)
+                except Exception as e:
+                    send_message(sock, {'type': 'error', 'message': str(e)})
+
+    def render(self, pdf_creator, task):
+        """Render one sheet side and return the PDF bytes"""
+        settings = task['settings']
+        pdf_creator.set_optimization(settings.get('optimize', True))
+        output_path = os.path.join(pdf_creator.temp_dir, f"task_{task['sheet']:03d}_{task['side']}.pdf")
+
+        pdf_creator.create_sheet(
+            [decode_source(source) for source in task['files']],
+            output_path,
+            card_width=settings.get('card_width', 63.5),
+            card_height=settings.get('card_height', 88.0),
+            bleed=settings.get('bleed', 2.5),
+            dpi=settings.get('dpi', 300),
+            is_verso=task['side'] == "verso",
+            reg_marks=settings.get('reg_marks', True),
+            color_bars=settings.get('color_bars', True)
+        )
+
+        with open(output_path, 'rb') as f:
+            payload = f.read()
+        pdf_creator.scratch.remove_file(output_path)
+        return payload
+
+def main():
+    """Command line entry point for the coordinator and worker modes"""
+    parser = argparse.ArgumentParser(
+        description="Render sheets across several worker processes or machines",
+        epilog=f"The shared secret is read from {TOKEN_ENV} (workers ask on stdin if it is not set)"
+    )
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Distribute a job and assemble the PDF")
+    coordinator_parser.add_argument("recto_files", nargs="+", help="Recto card files")
+    coordinator_parser.add_argument("--verso", required=True, help="File used for the verso side")
+    coordinator_parser.add_argument("--output", required=True, help="Output PDF path")
+    coordinator_parser.add_argument("--dpi", type=int, default=300, choices=[150, 300, 600])
+    coordinator_parser.add_argument("--no-reg-marks", action="store_true", help="Omit registration marks")
+    coordinator_parser.add_argument("--no-color-bars", action="store_true", help="Omit color bars")
+    coordinator_parser.add_argument("--no-optimize", action="store_true", help="Disable PDF size optimization")
+    coordinator_parser.add_argument("--host", default="127.0.0.1",
+                                    help="Address to listen on (0.0.0.0 for remote workers)")
+    coordinator_parser.add_argument("--port", type=int, default=0, help="Port to listen on (0 picks one)")
+    coordinator_parser.add_argument("--task-timeout", type=int, default=600,
+                                    help="Seconds a worker may take for one sheet side")
+    coordinator_parser.add_argument("--worker-wait", type=int, default=300,
+                                    help="Seconds to wait for a worker before giving up")
+    coordinator_parser.add_argument("--local-workers", type=int, default=0,
+                                    help="Start this many worker processes on this machine")
+
+    worker_parser = subparsers.add_parser("worker", help="Render sheets for a coordinator")
+    worker_parser.add_argument("--host", required=True, help="Coordinator address")
+    worker_parser.add_argument("--port", type=int, required=True, help="Coordinator port")
+    worker_parser.add_argument("--name", help="Name shown in the coordinator log")
+
+    args = parser.parse_args()
+
+    if args.mode == "worker":
+        RenderWorker(args.host, args.port, read_token(), args.name).run()
+        return 0
+
+    coordinator = RenderCoordinator(
+        args.recto_files,
+        args.verso,
+        args.output,
+        settings={
+            'dpi': args.dpi,
+            'reg_marks': not args.no_reg_marks,
+            'color_bars': not args.no_color_bars,
+            'optimize': not args.no_optimize
+        },
+        host=args.host,
+        port=args.port,
+        token=os.environ.get(TOKEN_ENV),
+        task_timeout=args.task_timeout,
+        worker_wait=args.worker_wait
+    )
+
+    if not os.environ.get(TOKEN_ENV):
+        print(f"Worker token: {coordinator.token}")
+
+    connect_host = "127.0.0.1" if args.host in ("0.0.0.0", "") else args.host
+    coordinator.start_local_workers(args.local_workers, connect_host)
+    coordinator.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# resource_governor.py
+import os
+import sys
+import time
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from image_loaders import read_image_info, get_loader, PSD_LOADER, LAYERED_PSD_LOADER
+
+# Environment override, so the budget can be tuned per host
+MEMORY_BUDGET_ENV = "TCG_MEMORY_BUDGET_MB"
+
+# Working memory of a decode relative to the raw pixel data
+PSD_COST_FACTOR = 4    # Layer buffers, composite and flattened copy
+FLAT_COST_FACTOR = 2   # Decoded image and flattened copy
+
+def read_rss():
+    """
+    Return the resident memory of this process in bytes. Without /proc (macOS) this
+    is the peak resident memory so far, which overstates memory that has been freed
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def read_available_memory():
+    """Return the memory available to new allocations in bytes, or None if unknown"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+class ResourceGovernor:
+    """
+    Admission control for the parallel decode path. Every card's memory cost is
+    estimated from its file header before it is decoded, decodes are admitted
+    while they fit the memory budget, and the concurrency limit is adjusted
+    from the resident memory and throughput the workers report
+    (halved under memory pressure, raised by one while it pays off).
+    """
+
+    def __init__(self, max_workers, memory_budget_mb=None, min_workers=1):
+        if memory_budget_mb is None and os.environ.get(MEMORY_BUDGET_ENV):
+            memory_budget_mb = float(os.environ[MEMORY_BUDGET_ENV])
+
+        if memory_budget_mb:
+            self.budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        else:
+            # Three quarters of what the machine has free when the job starts
+            available = read_available_memory()
+            self.budget_bytes = int(available * 0.75) if available else 2048 * 1024 * 1024
+
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.limit = self.max_workers
+        self.ceiling = self.max_workers
+
+        self.lock = threading.Lock()
+        self.estimates = {}
+        self.active = 0
+        self.active_bytes = 0
+        self.worker_rss = {}
+
+        # Throughput of the current limit, measured over a window of decodes
+        self.window_start = time.perf_counter()
+        self.window_decodes = 0
+        self.previous_rate = None
+        self.last_change = None
+
+        self.decisions = []
+        self.deferred = 0
+        self.peak_active_bytes = 0
+        self.peak_rss = 0
+
+    def estimate(self, source):
+        """Return the estimated decode memory of a card in bytes, from its header only"""
+        if source in self.estimates:
+            return self.estimates[source]
+
+        try:
+            info = read_image_info(source)
+            pixels = info['width'] * info['height']
+            bytes_per_pixel = max(info['channels'], 4) * max(info['depth'], 8) // 8
+            loader = get_loader(source)
+            factor = PSD_COST_FACTOR if loader in (PSD_LOADER, LAYERED_PSD_LOADER) else FLAT_COST_FACTOR
+            cost = pixels * bytes_per_pixel * factor
+        except Exception:
+            # Unreadable headers are reported by the decoder, assume a large card meanwhile
+            cost = 256 * 1024 * 1024
+
+        self.estimates[source] = cost
+        return cost
+
+    def try_admit(self, cost, required=False):
+        """
+        Reserve room for a decode. A required decode (the card the writer is waiting
+        for) is always admitted so the job keeps moving
+        Returns:
+            bool: True if the decode may start
+        """
+        with self.lock:
+            fits = (self.active < self.limit
+                    and self.active_bytes + cost <= self.budget_bytes)
+            if not (fits or required or self.active == 0):
+                self.deferred += 1
+                return False
+
+            self.active += 1
+            self.active_bytes += cost
+            self.peak_active_bytes = max(self.peak_active_bytes, self.active_bytes)
+            return True
+
+    def complete(self, cost, worker_pid=None, worker_rss=None):
+        """Release a finished decode and adapt the limit to what was observed"""
+        with self.lock:
+            self.active -= 1
+            self.active_bytes -= cost
+            if worker_pid is not None and worker_rss is not None:
+                self.worker_rss[worker_pid] = worker_rss
+
+            rss = read_rss() + sum(self.worker_rss.values())
+            self.peak_rss = max(self.peak_rss, rss)
+            self.window_decodes += 1
+
+            if rss > self.budget_bytes * 0.9:
+                # Multiplicative decrease as soon as memory gets tight
+                if self.limit > self.min_workers:
+                    self.change_limit(max(self.min_workers, self.limit // 2),
+                                      f"resident memory {rss / 1048576:.0f} MB near budget")
+                return
+
+            # Judge throughput over at least one decode per admitted slot
+            if self.window_decodes < max(2, self.limit):
+                return
+
+            elapsed = time.perf_counter() - self.window_start
+            rate = self.window_decodes / elapsed if elapsed > 0 else 0
+            self.window_start = time.perf_counter()
+            self.window_decodes = 0
+
+            if self.last_change == 'increase' and self.previous_rate and rate < self.previous_rate * 0.95:
+                # The extra decode did not pay off, go back and stay there
+                self.ceiling = self.limit - 1
+                self.change_limit(self.limit - 1,
+                                  f"throughput fell to {rate:.2f} cards/s from {self.previous_rate:.2f}")
+            elif self.limit < self.ceiling and rss < self.budget_bytes * 0.6:
+                self.change_limit(self.limit + 1,
+                                  f"resident memory {rss / 1048576:.0f} MB, {rate:.2f} cards/s")
+            else:
+                self.last_change = None
+            self.previous_rate = rate
+
+    def forget_worker(self, worker_pid):
+        """Drop the memory last reported by a worker process that has exited"""
+        with self.lock:
+            self.worker_rss.pop(worker_pid, None)
+
+    def change_limit(self, limit, reason):
+        """Set the concurrency limit and log why, call with the lock held"""
+        if limit == self.limit:
+            return
+        self.last_change = 'increase' if limit > self.limit else 'decrease'
+        self.decisions.append(f"{self.limit} -> {limit} decodes: {reason}")
+        print(f"Governor: {self.decisions[-1]}")
+        self.limit = limit
+
+    def report(self):
+        """Return a summary of the budget, observed memory and every limit change"""
+        lines = [
+            f"Governor: budget {self.budget_bytes / 1048576:.0f} MB, final limit {self.limit} of "
+            f"{self.max_workers} decodes, peak estimated in flight "
+            f"{self.peak_active_bytes / 1048576:.0f} MB, peak resident "
+            f"{self.peak_rss / 1048576:.0f} MB, {self.deferred} decodes deferred"
+        ]
+        lines.extend(f"  {decision}" for decision in self.decisions)
+        return "\n".join(lines)
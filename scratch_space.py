@@ -0,0 +1,151 @@
+# scratch_space.py
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+
+# Environment overrides, so scratch I/O can be moved to fast local storage per host
+SCRATCH_DIR_ENV = "TCG_SCRATCH_DIR"
+SCRATCH_QUOTA_ENV = "TCG_SCRATCH_QUOTA_MB"
+
+RAM_DISK = "ram"
+RAM_DISK_CANDIDATES = ["/dev/shm"]
+
+class ScratchQuotaError(Exception):
+    """Raised when the files of a job do not fit in the scratch quota"""
+
+class ScratchSpace:
+    """
+    Private scratch directory with a size quota, throughput statistics and
+    guaranteed removal. The quota covers every file the job keeps in it (card
+    JPEGs, sheet PDFs and cluster pages), so a job stops with a clear error
+    instead of filling a RAM disk or a shared volume
+    """
+
+    def __init__(self, location=None, quota_mb=None, prefix="cards_"):
+        location = location or os.environ.get(SCRATCH_DIR_ENV) or None
+        if quota_mb is None and os.environ.get(SCRATCH_QUOTA_ENV):
+            quota_mb = float(os.environ[SCRATCH_QUOTA_ENV])
+
+        if location == RAM_DISK:
+            location = next((path for path in RAM_DISK_CANDIDATES if os.path.isdir(path)), None)
+            if location is None:
+                print("Warning: No RAM disk available, using the default temporary directory")
+
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=location)
+        self.quota_bytes = int(quota_mb * 1024 * 1024) if quota_mb else None
+
+        self.lock = threading.Lock()
+        self.files = {}
+        self.used_bytes = 0
+        self.reserved_bytes = 0
+        self.peak_bytes = 0
+
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+
+        # Last resort if the owner never reaches cleanup()
+        atexit.register(self.cleanup)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def contains(self, path):
+        """Return True if a path lies inside the scratch directory"""
+        return os.path.abspath(path).startswith(os.path.abspath(self.path) + os.sep)
+
+    def new_file(self, suffix=""):
+        """Return the path of a new, empty file inside the scratch directory"""
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.path)
+        os.close(fd)
+        return path
+
+    def check_quota(self, nbytes=0):
+        """Raise ScratchQuotaError if nbytes more do not fit, call with the lock held"""
+        if self.quota_bytes is not None and self.used_bytes + self.reserved_bytes + nbytes > self.quota_bytes:
+            raise ScratchQuotaError(
+                f"Scratch quota of {self.quota_bytes / 1048576:.1f} MB exceeded in "
+                f"{self.path} ({self.used_bytes / 1048576:.1f} MB in use, "
+                f"{self.reserved_bytes / 1048576:.1f} MB reserved, "
+                f"{nbytes / 1048576:.1f} MB more needed)"
+            )
+
+    def reserve(self, nbytes):
+        """
+        Hold nbytes of the quota for an upcoming write whose size is known in advance
+        Raises ScratchQuotaError if it does not fit
+        """
+        with self.lock:
+            self.check_quota(nbytes)
+            self.reserved_bytes += nbytes
+            return nbytes
+
+    def add_file(self, path, reserved=0):
+        """
+        Account for a file written into scratch, replacing its reservation
+        Raises ScratchQuotaError if the file takes the job over the quota
+        """
+        size = os.path.getsize(path)
+        with self.lock:
+            self.reserved_bytes = max(0, self.reserved_bytes - reserved)
+            self.used_bytes += size - self.files.get(path, 0)
+            self.files[path] = size
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+            self.check_quota()
+
+    def cancel_reservation(self, reserved):
+        """Give back a reservation whose write did not happen"""
+        with self.lock:
+            self.reserved_bytes = max(0, self.reserved_bytes - reserved)
+
+    def remove_file(self, path):
+        """Delete a scratch file and free its space"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            self.used_bytes -= self.files.pop(path, 0)
+
+    def record_write(self, nbytes, seconds):
+        with self.lock:
+            self.bytes_written += nbytes
+            self.write_seconds += seconds
+
+    def record_read(self, nbytes, seconds):
+        with self.lock:
+            self.bytes_read += nbytes
+            self.read_seconds += seconds
+
+    def throughput_report(self):
+        """Return a one-line summary of scratch usage and throughput"""
+        def rate(nbytes, seconds):
+            return f"{nbytes / 1048576 / seconds:.1f} MB/s" if seconds > 0 else "n/a"
+
+        return (f"Scratch {self.path}: wrote {self.bytes_written / 1048576:.1f} MB at "
+                f"{rate(self.bytes_written, self.write_seconds)}, read "
+                f"{self.bytes_read / 1048576:.1f} MB at {rate(self.bytes_read, self.read_seconds)}, "
+                f"peak {self.peak_bytes / 1048576:.1f} MB")
+
+    def cleanup(self):
+        """Remove the scratch directory and everything in it, safe to call repeatedly"""
+        atexit.unregister(self.cleanup)
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            shutil.rmtree(self.path)
+        except Exception as e:
+            print(f"Warning: Could not clean up temporary directory: {str(e)}")
+
+        with self.lock:
+            self.files = {}
+            self.used_bytes = 0
+            self.reserved_bytes = 0
@@ -0,0 +1,181 @@
+# sheet_layout.py
+from PIL import Image, ImageDraw
+
+POINT_MM = 25.4 / 72  # PDF points to millimeters
+
+class SheetLayout:
+    """
+    Card placement and print mark geometry of one sheet, in millimeters
+    with the origin at the bottom left like the PDF canvas
+    """
+
+    def __init__(self, width_mm=210, height_mm=297, card_width=63.5, card_height=88.0,
+                 bleed=2.5, grid_size=3):
+        self.width_mm = width_mm
+        self.height_mm = height_mm
+        self.card_width = card_width
+        self.card_height = card_height
+        self.bleed = bleed
+        self.grid_size = grid_size
+
+        # Each grid cell is a card plus bleed on both sides
+        self.cell_width = card_width + 2 * bleed
+        self.cell_height = card_height + 2 * bleed
+        self.grid_width = grid_size * self.cell_width
+        self.grid_height = grid_size * self.cell_height
+        self.margin_x = (width_mm - self.grid_width) / 2
+        self.margin_y = (height_mm - self.grid_height) / 2
+
+    @property
+    def cards_per_sheet(self):
+        return self.grid_size * self.grid_size
+
+    def card_position(self, index, is_verso=False):
+        """Return the (x, y) of the bottom left corner of a card cell"""
+        row = index // self.grid_size
+        col = index % self.grid_size
+
+        if is_verso:
+            # Mirror positions for verso side
+            x = self.width_mm - (self.margin_x + (col * self.cell_width) + self.cell_width)
+        else:
+            x = self.margin_x + (col * self.cell_width)
+        y = self.height_mm - (self.margin_y + (row * self.cell_height) + self.cell_height)
+
+        return x, y
+
+    def trim_lines(self):
+        """Return the solid cut lines as ((x0, y0), (x1, y1)) pairs"""
+        lines = []
+        for i in range(self.grid_size + 1):
+            x = self.margin_x + (i * self.cell_width)
+            lines.append(((x, self.margin_y), (x, self.margin_y + self.grid_height)))
+
+            y = self.margin_y + (i * self.cell_height)
+            lines.append(((self.margin_x, y), (self.margin_x + self.grid_width, y)))
+        return lines
+
+    def bleed_lines(self):
+        """Return the dashed bleed lines between cards"""
+        lines = []
+        for i in range(1, self.grid_size):
+            x = self.margin_x + (i * self.cell_width)
+            for offset in (-self.bleed, self.bleed):
+                lines.append(((x + offset, self.margin_y),
+                              (x + offset, self.margin_y + self.grid_height)))
+
+            y = self.margin_y + (i * self.cell_height)
+            for offset in (-self.bleed, self.bleed):
+                lines.append(((self.margin_x, y + offset),
+                              (self.margin_x + self.grid_width, y + offset)))
+        return lines
+
+    def registration_points(self):
+        """Return the centres of the registration marks"""
+        center_x = self.margin_x + (self.grid_width / 2)
+        center_y = self.margin_y + (self.grid_height / 2)
+        right = self.margin_x + self.grid_width
+        top = self.margin_y + self.grid_height
+
+        return [
+            (self.margin_x, self.margin_y), (right, self.margin_y),
+            (self.margin_x, top), (right, top),
+            (center_x, self.margin_y), (center_x, top),
+            (self.margin_x, center_y), (right, center_y)
+        ]
+
+    def color_bars(self):
+        """Return the colour bars as (x, y, width, height, rgb) below the grid"""
+        bar_width = self.grid_width / 4
+        y = self.margin_y - 10
+        colors = [(0, 255, 255), (255, 0, 255), (255, 255, 0), (0, 0, 0)]
+        return [
+            (self.margin_x + bar_width * i, y, bar_width, 5, color)
+            for i, color in enumerate(colors)
+        ]
+
+def draw_dashed_line(draw, start, end, dash, width, fill):
+    """Draw a horizontal or vertical dashed line"""
+    (x0, y0), (x1, y1) = start, end
+    length = max(abs(x1 - x0), abs(y1 - y0))
+    if length == 0:
+        return
+
+    step_x = (x1 - x0) / length
+    step_y = (y1 - y0) / length
+    position = 0
+    while position < length:
+        stop = min(position + dash, length)
+        draw.line(
+            [(x0 + step_x * position, y0 + step_y * position),
+             (x0 + step_x * stop, y0 + step_y * stop)],
+            fill=fill, width=width
+        )
+        position += dash * 2
+
+def draw_sheet_marks(draw, layout, scale, offset_y=0, reg_marks=True, color_bars=True):
+    """
+    Draw cut lines, registration marks and colour bars with PIL
+    Args:
+        draw: ImageDraw of the target image
+        layout: SheetLayout of the sheet
+        scale: Pixels per millimeter
+        offset_y: Top row of the target image within the full sheet, for strips
+    """
+    def to_pixels(point):
+        x, y = point
+        return (x * scale, (layout.height_mm - y) * scale - offset_y)
+
+    def line_width(points):
+        return max(1, round(points * POINT_MM * scale))
+
+    # Trim lines
+    for start, end in layout.trim_lines():
+        draw.line([to_pixels(start), to_pixels(end)], fill=(0, 0, 0), width=line_width(0.25))
+
+    # Bleed lines (dashed)
+    for start, end in layout.bleed_lines():
+        draw_dashed_line(
+            draw, to_pixels(start), to_pixels(end),
+            dash=2 * POINT_MM * scale, width=line_width(0.15), fill=(128, 128, 128)
+        )
+
+    if reg_marks:
+        reg_size = 5 * scale
+        radius = 0.5 * scale
+        for point in layout.registration_points():
+            x, y = to_pixels(point)
+            draw.line([(x - reg_size, y), (x + reg_size, y)], fill=(0, 0, 0), width=line_width(0.25))
+            draw.line([(x, y - reg_size), (x, y + reg_size)], fill=(0, 0, 0), width=line_width(0.25))
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius],
+                         outline=(0, 0, 0), width=line_width(0.25))
+
+    if color_bars:
+        for x, y, width, height, color in layout.color_bars():
+            left, bottom = to_pixels((x, y))
+            right, top = to_pixels((x + width, y + height))
+            draw.rectangle([left, top, right, bottom], fill=color, outline=(0, 0, 0))
+
+def render_sheet_image(layout, images, scale, is_verso=False, reg_marks=True, color_bars=True):
+    """
+    Rasterise a whole sheet at a low resolution
+    Args:
+        layout: SheetLayout of the sheet
+        images: Card images in grid order (at most one sheet)
+        scale: Pixels per millimeter
+    Returns:
+        PIL Image: RGB image of the page
+    """
+    page = Image.new('RGB', (round(layout.width_mm * scale), round(layout.height_mm * scale)), "white")
+    cell_size = (round(layout.cell_width * scale), round(layout.cell_height * scale))
+
+    for i, image in enumerate(images[:layout.cards_per_sheet]):
+        x, y = layout.card_position(i, is_verso)
+        left = round(x * scale)
+        top = round((layout.height_mm - y - layout.cell_height) * scale)
+        if image.size != cell_size:
+            image = image.resize(cell_size, Image.Resampling.BILINEAR)
+        page.paste(image, (left, top))
+
+    draw_sheet_marks(ImageDraw.Draw(page), layout, scale, reg_marks=reg_marks, color_bars=color_bars)
+    return page
@@ -0,0 +1,273 @@
+# tiff_export.py
+import io
+import zlib
+import struct
+from PIL import Image, ImageDraw, features
+
+from sheet_layout import draw_sheet_marks
+
+# TIFF compression tag values
+COMPRESSION_NONE = "none"
+COMPRESSION_LZW = "lzw"
+COMPRESSION_DEFLATE = "deflate"
+COMPRESSION_TAGS = {COMPRESSION_NONE: 1, COMPRESSION_LZW: 5, COMPRESSION_DEFLATE: 8}
+
+# Field types
+SHORT = 3
+LONG = 4
+RATIONAL = 5
+
+def lzw_compress(data):
+    """Compress bytes with the TIFF flavour of LZW (MSB first, clear code 256, end 257)"""
+    clear_code, end_code = 256, 257
+    output = bytearray()
+    bit_buffer = 0
+    bit_count = 0
+
+    table = {}
+    next_code = 258
+    width = 9
+
+    def emit(code, width):
+        nonlocal bit_buffer, bit_count
+        bit_buffer = (bit_buffer << width) | code
+        bit_count += width
+        while bit_count >= 8:
+            bit_count -= 8
+            output.append((bit_buffer >> bit_count) & 0xFF)
+        bit_buffer &= (1 << bit_count) - 1
+
+    emit(clear_code, width)
+    if not data:
+        emit(end_code, width)
+        if bit_count:
+            output.append((bit_buffer << (8 - bit_count)) & 0xFF)
+        return bytes(output)
+
+    prefix = data[0]
+    for byte in data[1:]:
+        key = (prefix << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        emit(prefix, width)
+        table[key] = next_code
+        next_code += 1
+        prefix = byte
+
+        # Same code width schedule as libtiff, the table restarts before codes pass 12 bits
+        if next_code == 4094:
+            emit(clear_code, width)
+            table = {}
+            next_code = 258
+            width = 9
+        elif next_code > (1 << width) - 1:
+            width += 1
+
+    emit(prefix, width)
+    # The decoder adds one more entry on reading the last code, the end code follows its width
+    next_code += 1
+    if next_code == 4094:
+        emit(clear_code, width)
+        width = 9
+    elif next_code > (1 << width) - 1:
+        width += 1
+    emit(end_code, width)
+    if bit_count:
+        output.append((bit_buffer << (8 - bit_count)) & 0xFF)
+    return bytes(output)
+
+def libtiff_lzw_compress(image):
+    """
+    Compress an RGB strip with libtiff's LZW encoder through Pillow
+    Returns None if libtiff is not available, the caller then uses lzw_compress
+    """
+    if not features.check('libtiff'):
+        return None
+
+    # Written as a single strip, whose data is copied out as it is
+    buffer = io.BytesIO()
+    image.save(buffer, 'TIFF', compression='tiff_lzw', tiffinfo={278: image.height})
+    buffer.seek(0)
+    with Image.open(buffer) as written:
+        offsets = written.tag_v2.get(273)
+        byte_counts = written.tag_v2.get(279)
+    if offsets is None or len(offsets) != 1:
+        return None
+    return buffer.getvalue()[offsets[0]:offsets[0] + byte_counts[0]]
+
+class TiffStripWriter:
+    """
+    Writes an 8 bit RGB TIFF one horizontal strip at a time, so the full
+    image never has to exist in memory
+    """
+
+    def __init__(self, path, width, height, rows_per_strip=256, compression=COMPRESSION_NONE, dpi=300):
+        if compression not in COMPRESSION_TAGS:
+            raise ValueError(f"Unsupported TIFF compression: {compression}")
+
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows_per_strip = rows_per_strip
+        self.compression = compression
+        self.dpi = dpi
+        self.strip_offsets = []
+        self.strip_byte_counts = []
+        self.rows_written = 0
+
+        # Header with the IFD offset filled in on close
+        self.file = open(path, 'wb')
+        self.file.write(b'II' + struct.pack('<HI', 42, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_strip(self, image):
+        """Append the next strip, an RGB image of rows_per_strip rows (fewer for the last)"""
+        expected = min(self.rows_per_strip, self.height - self.rows_written)
+        if image.size != (self.width, expected) or image.mode != 'RGB':
+            raise ValueError(f"Expected an RGB strip of {self.width}x{expected}, got "
+                             f"{image.mode} {image.width}x{image.height}")
+
+        data = image.tobytes()
+        if self.compression == COMPRESSION_DEFLATE:
+            data = zlib.compress(data, 6)
+        elif self.compression == COMPRESSION_LZW:
+            # The pure Python encoder is many times slower, only used without libtiff
+            compressed = libtiff_lzw_compress(image)
+            data = compressed if compressed is not None else lzw_compress(data)
+
+        self.strip_offsets.append(self.file.tell())
+        self.strip_byte_counts.append(len(data))
+        self.file.write(data)
+        # Offsets in a TIFF must be word aligned
+        if len(data) % 2:
+            self.file.write(b'\0')
+
+        self.rows_written += expected
+
+    def write_values(self, field_type, values):
+        """Write an out-of-line tag value array and return its offset"""
+        offset = self.file.tell()
+        # Rationals are pairs of LONGs
+        code = 'H' if field_type == SHORT else 'I'
+        self.file.write(struct.pack(f'<{len(values)}{code}', *values))
+        if self.file.tell() % 2:
+            self.file.write(b'\0')
+        return offset
+
+    def close(self):
+        """Write the image file directory and finish the file"""
+        if self.rows_written != self.height:
+            self.file.close()
+            raise ValueError(f"TIFF has {self.rows_written} of {self.height} rows")
+
+        resolution = (int(self.dpi * 10000), 10000)
+
+        entries = [
+            (256, LONG, [self.width]),
+            (257, LONG, [self.height]),
+            (258, SHORT, [8, 8, 8]),
+            (259, SHORT, [COMPRESSION_TAGS[self.compression]]),
+            (262, SHORT, [2]),  # RGB
+            (273, LONG, self.strip_offsets),
+            (277, SHORT, [3]),
+            (278, LONG, [self.rows_per_strip]),
+            (279, LONG, self.strip_byte_counts),
+            (282, RATIONAL, list(resolution)),
+            (283, RATIONAL, list(resolution)),
+            (284, SHORT, [1]),  # Chunky
+            (296, SHORT, [2]),  # Inches
+        ]
+
+        # Values that do not fit the 4 byte field go before the directory
+        fields = []
+        for tag, field_type, values in entries:
+            count = len(values) // 2 if field_type == RATIONAL else len(values)
+            size = {SHORT: 2, LONG: 4, RATIONAL: 8}[field_type] * count
+            if size <= 4:
+                packed = struct.pack('<2H' if field_type == SHORT and count == 2 else
+                                     '<H2x' if field_type == SHORT else '<I', *values)
+            else:
+                packed = struct.pack('<I', self.write_values(field_type, values))
+            fields.append(struct.pack('<HHI', tag, field_type, count) + packed)
+
+        ifd_offset = self.file.tell()
+        self.file.write(struct.pack('<H', len(fields)) + b''.join(fields) + struct.pack('<I', 0))
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', ifd_offset))
+        self.file.close()
+
+def write_sheet_tiff(layout, images, output_path, dpi=300, is_verso=False, reg_marks=True,
+                     color_bars=True, compression=COMPRESSION_NONE, rows_per_strip=256):
+    """
+    Composite an imposed sheet into a TIFF strip by strip
+    Only the grid row of cards under the current strip is held in memory
+    Args:
+        layout: SheetLayout of the sheet
+        images: Iterator of decoded card images in grid order
+        output_path: TIFF file to write
+        dpi: Output resolution
+    """
+    scale = dpi / 25.4
+    width = round(layout.width_mm * scale)
+    height = round(layout.height_mm * scale)
+    cell_size = (round(layout.cell_width * scale), round(layout.cell_height * scale))
+
+    images = iter(images)
+    placed = []   # (index, left, top, image) of loaded cards
+    next_index = 0
+    exhausted = False
+
+    def cell_box(index):
+        x, y = layout.card_position(index, is_verso)
+        return round(x * scale), round((layout.height_mm - y - layout.cell_height) * scale)
+
+    with TiffStripWriter(output_path, width, height, rows_per_strip, compression, dpi) as writer:
+        for top in range(0, height, rows_per_strip):
+            bottom = min(top + rows_per_strip, height)
+
+            # Load the cards whose cells start above the bottom of this strip
+            while not exhausted and next_index < layout.cards_per_sheet:
+                left, cell_top = cell_box(next_index)
+                if cell_top >= bottom:
+                    break
+                try:
+                    image = next(images)
+                except StopIteration:
+                    exhausted = True
+                    break
+                # Copied or resized, decoders may reuse the buffer of the image they handed over
+                if image.size != cell_size:
+                    image = image.resize(cell_size, Image.Resampling.LANCZOS)
+                else:
+                    image = image.copy()
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                placed.append((next_index, left, cell_top, image))
+                next_index += 1
+
+            # Cards that ended above this strip are released
+            placed = [entry for entry in placed if entry[2] + cell_size[1] > top]
+
+            strip = Image.new('RGB', (width, bottom - top), "white")
+            for _, left, cell_top, image in placed:
+                if cell_top < bottom:
+                    crop = image.crop((0, max(0, top - cell_top), cell_size[0],
+                                       min(cell_size[1], bottom - cell_top)))
+                    strip.paste(crop, (left, max(0, cell_top - top)))
+
+            draw_sheet_marks(ImageDraw.Draw(strip), layout, scale, offset_y=top,
+                             reg_marks=reg_marks, color_bars=color_bars)
+            writer.write_strip(strip)
+
+    return output_path